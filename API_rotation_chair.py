@@ -1,3 +1,6 @@
+import numpy as np
+from numpy.typing import ArrayLike
+
 ## Constants
 RESOLUTION_MOTOR = 2**16                            # [counts/rev_motor]
 GEAR_RATIO = 2**7                                   # [rev_motor/rev_output]
@@ -49,6 +52,18 @@ def dec(val:float|None=None) -> str:
         return f"dec {_degs2rpm(val)}"
     return "dec"
 
+def velocity() -> str:
+    """
+    Gets the actual velocity of the rotation chair (in rpm).
+    """
+    return "v"
+
+def position() -> str:
+    """
+    Gets the actual position of the rotation chair (in counts).
+    """
+    return "pfb"
+
 
 ## Motion Commands
 def jogging(angular_velocity:float, duration:float|None=None) -> str:
@@ -67,6 +82,23 @@ def jogging(angular_velocity:float, duration:float|None=None) -> str:
     return f"j {_degs2rpm(angular_velocity)}"
 
 
+def jogging_table(position_table:list[float], sampling_time:float) -> list[str]:
+    '''
+    JOGGING commands that follow a table of absolute angles, one per time step of equal length.\r
+    The velocities are rounded against the angles of the table (see quantised_rpm_table),
+    so neither the rounding nor the step-wise velocity adds up into a position drift over the run.
+    Pass unrounded angles (SumOfSinesMotion.exact_positions), not the rounded position_table.
+    
+    :param position_table: Absolute angle at the start of each time step (in degrees)
+    :type position_table: list[float]
+    :param sampling_time: Length of a time step (in seconds)
+    :type sampling_time: float
+    :return: Command string for each time step
+    :rtype: list[str]
+    '''
+    return [f"j {rpm}" for rpm in quantised_rpm_table(position_table, sampling_time).tolist()]
+
+
 def moveabs(angle:float, angular_velocity:float) -> str:
     '''
     Executes an absolute position movement according to the acceleration settings that are in effect.
@@ -98,6 +130,26 @@ def moveinc(angle:float, angular_velocity:float, blending_mode:int = 2) -> str:
     return f"moveinc {_deg2counts(angle)} {_degs2rpm(angular_velocity)} {blending_mode}"
 
 
+def moveinc_table(position_table:list[float], angular_velocity:float, blending_mode:int = 2) -> list[str]:
+    '''
+    MOVEINC commands that follow a table of absolute angles, starting from the first one.\r
+    The increments are taken between the rounded cumulative counts instead of flooring each increment,
+    so every commanded angle stays within half a count of the table.
+    
+    :param position_table: Absolute angle of each step (in degrees)
+    :type position_table: list[float]
+    :param angular_velocity: Target angular velocity (in deg/s)
+    :type angular_velocity: float
+    :param blending_mode: See moveinc
+    :type blending_mode: int
+    :return: Command string for each step after the first one
+    :rtype: list[str]
+    '''
+    counts = deg2counts(np.asarray(position_table, dtype=float) - position_table[0], rounding="nearest")
+    rpm = _degs2rpm(angular_velocity)
+    return [f"moveinc {inc} {rpm} {blending_mode}" for inc in np.diff(counts).tolist()]
+
+
 ## Communication Commands
 def quiet() -> str:
     """
@@ -131,11 +183,14 @@ def record(sample_time:float, num_points:int, var:str = '"MECHANGLE "V') -> str:
     sampling_time = int(round(sample_time * 1000000 / 31.25))  # Convert seconds to units of 31.25 microseconds
     return f"record {sampling_time} {num_points} {var}"
 
-def trigger_record() -> str:
+def trigger_record(source:str = '"CMD') -> str:
     """
-    Triggers the start of data recording on the rotation chair when the next 'command' is sent.
+    Triggers the start of data recording on the rotation chair.
+    
+    :param source: '"CMD' to start when the next 'command' is sent (default), '"IMM' to start immediately.
+    :type source: str
     """
-    return 'rectrig "CMD'
+    return f'rectrig {source}'
 
 def get_recorded_data() -> str:
     """
@@ -185,4 +240,147 @@ def _degs2rpm(angular_velocity:float) -> float:
     '''
     angular_velocity *= 60    # Convert deg/s to deg/min
     angular_velocity /= 360  # Convert deg/min to rev/min (rpm)
-    return round(angular_velocity, 2)
\ No newline at end of file
+    return round(angular_velocity, 2)
+
+
+def quantised_rpm_table(position_table:list[float], sampling_time:float) -> np.ndarray:
+    '''
+    Velocities in 0.01 rpm that jog through a table of absolute angles, with error feedback (first order sigma-delta).\r
+    The angle to reach at the end of every step, divided by the step, is rounded to the rpm quantum and the
+    velocities are the differences, so the residual of a step is carried into the next one and the jogged angle
+    never drifts further than half a quantum (0.005 rpm = 0.03 deg/s) times one time step from the table.
+    The last step continues the slope of the table.\r
+    Alignment: the jog of step i is the mean velocity from t_i to t_i+1, which is the velocity of the motion
+    at t_i + dt/2, half a step ahead of speed_table[i]. This keeps the jogged angle on the table at every t_i.\r
+    The angles should be unrounded (SumOfSinesMotion.exact_positions): differencing a table rounded to
+    0.01 deg turns the rounding into acceleration spikes of up to 0.01 deg / dt^2.
+    
+    :param position_table: Absolute angle at the start of each time step (in degrees)
+    :type position_table: list[float]
+    :param sampling_time: Length of a time step (in seconds)
+    :type sampling_time: float
+    :return: Angular velocity of each time step (in rpm), multiples of 0.01
+    :rtype: np.ndarray
+    '''
+    position = np.asarray(position_table, dtype=float)
+    target = np.append(position[1:], 2 * position[-1] - position[-2]) - position[0]      # [deg] at the end of each step
+    cumulative = np.rint(degs2rpm(target / sampling_time, rounding=None) * 100).astype(np.int64)
+    return np.diff(cumulative, prepend=0) / 100
+
+
+## Bulk Conversions
+# The array versions of the conversions above, for numpy arrays, array.array buffers and lists.
+# array.array buffers are read in place through the buffer protocol, without a copy.
+# Rounding policies: "nearest" (halves to even), "floor", "trunc", or None to keep the exact float.
+ROUNDING_POLICIES = ("nearest", "floor", "trunc", None)
+
+def deg2counts(angle:ArrayLike, rounding:str|None = "nearest") -> np.ndarray:
+    '''
+    Converts angles in degrees to counts.\r
+    rounding="floor" gives the same counts as _deg2counts.
+    
+    :param angle: Angles in degrees
+    :type angle: ArrayLike
+    :param rounding: See ROUNDING_POLICIES
+    :type rounding: str | None
+    :return: Angles in counts, int64 (float64 if rounding is None)
+    :rtype: np.ndarray
+    '''
+    counts = np.asarray(angle, dtype=float) * RES_TOTAL / 360
+    if rounding is None:
+        return counts
+    return _round(counts, rounding).astype(np.int64)
+
+
+def counts2deg(count:ArrayLike) -> np.ndarray:
+    '''
+    Converts counts to angles in degrees, keeping the fraction of a degree (unlike _counts2deg).
+    
+    :param count: Angles in counts
+    :type count: ArrayLike
+    :return: Angles in degrees, float64
+    :rtype: np.ndarray
+    '''
+    return np.asarray(count, dtype=float) * 360 / RES_TOTAL
+
+
+def degs2rpm(angular_velocity:ArrayLike, rounding:str|None = "nearest", decimals:int = 2) -> np.ndarray:
+    '''
+    Converts angular velocities in degrees per second to rpm.\r
+    rounding="nearest" gives the values of _degs2rpm.
+    
+    :param angular_velocity: Angular velocities in degrees per second
+    :type angular_velocity: ArrayLike
+    :param rounding: See ROUNDING_POLICIES
+    :type rounding: str | None
+    :param decimals: Number of decimals rounded to (the drive takes 2)
+    :type decimals: int
+    :return: Angular velocities in rpm, float64
+    :rtype: np.ndarray
+    '''
+    rpm = np.asarray(angular_velocity, dtype=float) * 60 / 360
+    if rounding is None:
+        return rpm
+    scale = 10 ** decimals
+    return _round(rpm * scale, rounding) / scale
+
+
+def rpm2degs(rpm:ArrayLike) -> np.ndarray:
+    '''
+    Converts angular velocities in rpm to degrees per second.
+    
+    :param rpm: Angular velocities in rpm
+    :type rpm: ArrayLike
+    :return: Angular velocities in degrees per second, float64
+    :rtype: np.ndarray
+    '''
+    return np.asarray(rpm, dtype=float) * 360 / 60
+
+
+def _round(values:np.ndarray, rounding:str) -> np.ndarray:
+    if rounding == "nearest":
+        return np.rint(values)
+    if rounding == "floor":
+        return np.floor(values)
+    if rounding == "trunc":
+        return np.trunc(values)
+    raise ValueError(f"Unknown rounding policy {rounding!r}, choose from {ROUNDING_POLICIES}.")
+
+
+if __name__ == "__main__":
+    from keshner_motion import KeshnerMotion
+
+    for motion in [KeshnerMotion(0.02), KeshnerMotion(0.02, bands=(False, True, True))]:
+        dt = motion.sampling_time
+        position = motion.exact_positions()
+        target = deg2counts(position[1:] - position[0], rounding=None)      # [counts] at the end of each step
+        naive = deg2counts(np.cumsum(rpm2degs([_degs2rpm(v) for v in motion.speed_table])) * dt, rounding=None)[:-1]
+        fed_back = deg2counts(np.cumsum(rpm2degs(quantised_rpm_table(position, dt))) * dt, rounding=None)[:-1]
+        print(f"Bands {motion.bands}")
+        for name, angle in [("rounded per step", naive), ("error feedback", fed_back)]:
+            error = angle - target
+            print(f"\tjog, {name}:\tend {error[-1]:.1f} counts, max {np.abs(error).max():.1f} counts")
+
+        exact = (position - position[0]) * RES_TOTAL / 360
+        floored = np.cumsum([0] + [_deg2counts(b - a) for a, b in zip(position, position[1:])])
+        rounded = np.cumsum([0] + [int(cmd.split()[1]) for cmd in moveinc_table(position, 20)])
+        for name, counts in [("floored per step", floored), ("error feedback", rounded)]:
+            error = counts - exact
+            print(f"\tmoveinc, {name}:\tend {error[-1]:.1f} counts, max {np.abs(error).max():.1f} counts")
+
+    # Bulk conversions against the scalar ones
+    import array
+    import timeit
+    rng = np.random.default_rng(0)
+    angles = array.array("d", rng.uniform(-3600, 3600, 100_000))
+    speeds = array.array("d", rng.uniform(-180, 180, 100_000))
+    counts = array.array("q", deg2counts(angles).tolist())
+    print(f"{len(angles)} samples, array.array input")
+    for name, scalar, bulk, same in [
+            ("deg -> counts (floor)", lambda: [_deg2counts(a) for a in angles], lambda: deg2counts(angles, rounding="floor"), lambda x: x),
+            ("counts -> deg", lambda: [_counts2deg(c) for c in counts], lambda: counts2deg(counts), np.floor),     # the scalar floors to int
+            ("deg/s -> rpm (nearest)", lambda: [_degs2rpm(v) for v in speeds], lambda: degs2rpm(speeds), lambda x: x)]:
+        t_scalar = min(timeit.repeat(scalar, number=1, repeat=3))
+        t_bulk = min(timeit.repeat(bulk, number=1, repeat=3))
+        differ = np.count_nonzero(np.asarray(scalar(), dtype=float) != same(bulk()))
+        print(f"\t{name}:\tscalar {t_scalar*1000:.2f} ms, bulk {t_bulk*1000:.3f} ms (x{t_scalar/t_bulk:.0f}), {differ} values differ")
@@ -0,0 +1,174 @@
+import threading
+import time
+from typing import Callable
+
+import serial.tools.list_ports
+
+
+class ConnectionWatchdog:
+    """
+    Detects a dead link and reconnects.\r
+    Every received line counts as a sign of life. When the link has been quiet for PROBE_INTERVAL,
+    a lightweight probe is sent; if nothing comes back within STALL_TIMEOUT, or a read/write error is
+    reported, reconnect() is called until it succeeds or RECONNECT_TIMEOUT has passed.
+    An outage is counted from the last line received before the stall.
+    """
+
+    # CONSTANT
+    PROBE_INTERVAL = 1.0        #[s] quiet time before a probe is sent
+    STALL_TIMEOUT = 1.5         #[s] time a probe may stay unanswered
+    RECONNECT_TIMEOUT = 10.0    #[s] time given to get the link back
+    RETRY_INTERVAL = 0.2        #[s] time between reconnect attempts
+
+    def __init__(self,
+                 probe:Callable[[], None],
+                 reconnect:Callable[[], bool],
+                 is_paused:Callable[[], bool] = lambda: False,
+                 on_event:Callable[[str], None] = print,
+                 on_failed:Callable[[], None] = lambda: None) -> None:
+        """
+        :param probe: Sends a command the drive always answers
+        :type probe: Callable[[], None]
+        :param reconnect: Reopens the link and restores the drive state, returns whether it succeeded
+        :type reconnect: Callable[[], bool]
+        :param is_paused: Whether the link is expected to be silent (e.g. while the reader is paused)
+        :type is_paused: Callable[[], bool]
+        :param on_event: Called with a message on every outage, reconnect and failure
+        :type on_event: Callable[[str], None]
+        :param on_failed: Called when the link could not be recovered; the watchdog stops afterwards
+        :type on_failed: Callable[[], None]
+        """
+        self.probe = probe
+        self.reconnect = reconnect
+        self.is_paused = is_paused
+        self.on_event = on_event
+        self.on_failed = on_failed
+
+        self.last_rx = time.monotonic()
+        self.t_probe = None
+        self.outages: list[tuple[float, float]] = []       # (start, duration) on the time.monotonic() clock
+        self._failure = threading.Event()
+        self._stop = threading.Event()
+        self._reconnecting = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    ### EXTERNAL FUNCTIONS
+    def start(self) -> None:
+        self.last_rx = time.monotonic()
+        self.thread.start()
+        return
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._failure.set()
+        return
+
+    def notify_rx(self) -> None:
+        """
+        Call on every received line.
+        """
+        self.last_rx = time.monotonic()
+        self.t_probe = None
+        return
+
+    def notify_failure(self) -> None:
+        """
+        Call on a read or write error, to reconnect without waiting for the probe.
+        """
+        if not self._reconnecting:
+            self._failure.set()
+        return
+
+
+    ### INTERNAL FUNCTIONS
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            failed = self._failure.wait(self.PROBE_INTERVAL / 4)
+            if self._stop.is_set():
+                return
+            now = time.monotonic()
+            t_outage = now
+
+            if not failed:
+                if self.is_paused():
+                    self.last_rx = now
+                    self.t_probe = None
+                    continue
+                if self.t_probe is None and now - self.last_rx > self.PROBE_INTERVAL:
+                    self.t_probe = now
+                    try:
+                        self.probe()
+                    except Exception:
+                        failed = True
+                elif self.t_probe is not None and now - self.t_probe > self.STALL_TIMEOUT:
+                    failed = True
+                    t_outage = self.last_rx
+
+            if failed:
+                self._recover(t_outage)
+        return
+
+    def _recover(self, t_outage:float) -> None:
+        self._reconnecting = True
+        self.on_event(f"Connection lost, reconnecting (up to {self.RECONNECT_TIMEOUT} s)...")
+
+        recovered = False
+        while not self._stop.is_set() and time.monotonic() - t_outage < self.RECONNECT_TIMEOUT:
+            try:
+                recovered = self.reconnect()
+            except Exception:
+                recovered = False
+            if recovered:
+                break
+            self._stop.wait(self.RETRY_INTERVAL)
+
+        duration = time.monotonic() - t_outage
+        self.outages.append((t_outage, duration))
+        if recovered:
+            self.on_event(f"Reconnected after {duration:.2f} s")
+        elif not self._stop.is_set():
+            self.on_event(f"Reconnect failed after {duration:.2f} s")
+            self._stop.set()
+            self.on_failed()
+
+        self.last_rx = time.monotonic()
+        self.t_probe = None
+        self._failure.clear()
+        self._reconnecting = False
+        return
+
+
+def port_identity(device:str) -> tuple[str|None, int|None, int|None]:
+    '''
+    :return: Serial number, VID and PID of a serial port, None where unknown
+    :rtype: tuple[str | None, int | None, int | None]
+    '''
+    for port in serial.tools.list_ports.comports():
+        if port.device == device:
+            return port.serial_number, port.vid, port.pid
+    return None, None, None
+
+
+def find_port(serial_number:str|None, vid:int|None, pid:int|None, fallback:str|None = None) -> str|None:
+    '''
+    Find the port of a device after it re-enumerated, possibly under another name.\r
+    The serial number is matched first, then the VID:PID if it is unique.
+
+    :param fallback: The port name to use when the device cannot be identified
+    :return: The port name, or None if the device is not there
+    :rtype: str | None
+    '''
+    ports = list(serial.tools.list_ports.comports())
+    if serial_number:
+        for port in ports:
+            if port.serial_number == serial_number:
+                return port.device
+        return None
+    if vid is not None and pid is not None:
+        matches = [port.device for port in ports if (port.vid, port.pid) == (vid, pid)]
+        if len(matches) == 1:
+            return matches[0]
+        if fallback in matches:
+            return fallback
+        return None
+    return fallback if fallback in [port.device for port in ports] else None
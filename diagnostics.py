@@ -0,0 +1,269 @@
+import collections
+import datetime
+import os
+import sys
+import threading
+import time
+from typing import Callable
+
+
+PROFILE_FOLDER = "../Session Logs"
+
+
+def thread_cpu_times() -> dict[int, tuple[str, float]]:
+    '''
+    CPU time of every live thread.\r
+    On Linux it is read from /proc (10 ms resolution), which stays safe when a thread exits meanwhile;
+    elsewhere from the per-thread CPU clock where the platform has one, otherwise nothing.
+
+    :return: (name, CPU time [s]) by native thread id
+    :rtype: dict[int, tuple[str, float]]
+    '''
+    times = {}
+    if os.path.isdir("/proc/self/task"):
+        ticks = os.sysconf("SC_CLK_TCK")
+        for thread in threading.enumerate():
+            try:
+                with open(f"/proc/self/task/{thread.native_id}/stat") as stat:
+                    fields = stat.read().rsplit(")", 1)[1].split()
+            except (OSError, IndexError):
+                continue
+            times[thread.native_id] = (thread.name, (int(fields[11]) + int(fields[12])) / ticks)     # utime + stime
+    elif hasattr(time, "pthread_getcpuclockid"):
+        for thread in threading.enumerate():
+            try:
+                times[thread.native_id] = (thread.name, time.clock_gettime(time.pthread_getcpuclockid(thread.ident)))
+            except (OSError, TypeError):
+                continue
+    return times
+
+
+class Diagnostics:
+    """
+    Lightweight instrumentation of the running application.\r
+    Once per SAMPLE_INTERVAL a background thread reads the registered gauges (queue depths, shown as they are)
+    and counters (running totals, shown per second), and the CPU use of every thread.
+    The Tk frame latency is measured by a callback re-scheduled with after(): how late it runs is
+    how long the event loop was busy.
+    """
+
+    # CONSTANT
+    SAMPLE_INTERVAL = 1.0       #[s]
+    FRAME_PERIOD = 50           #[ms] period of the frame latency probe
+
+    def __init__(self, interval:float = SAMPLE_INTERVAL) -> None:
+        self.interval = interval
+        self.gauges: dict[str, Callable[[], float]] = {}
+        self.counters: dict[str, Callable[[], float]] = {}
+        self.values: dict[str, float] = {}          # latest gauges and rates
+        self.thread_cpu: dict[str, float] = {}      # [%] of one core, latest interval
+        self.lock = threading.Lock()
+
+        self._frame_latency: list[float] = []
+        self._watching_tk = False
+        self._stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True, name="Diagnostics")
+
+    ### EXTERNAL FUNCTIONS
+    def add_gauge(self, name:str, read:Callable[[], float]) -> None:
+        self.gauges[name] = read
+        return
+
+    def add_counter(self, name:str, read:Callable[[], float]) -> None:
+        '''
+        :param read: Returns the running total; its increase per second is shown
+        '''
+        self.counters[name] = read
+        return
+
+    def watch_tk(self, widget) -> None:
+        '''
+        Start the frame latency probe on the event loop of a Tk widget.
+        '''
+        self._watching_tk = True
+        def probe(expected:float) -> None:
+            now = time.perf_counter()
+            with self.lock:
+                self._frame_latency.append(now - expected)
+            if not self._stop.is_set():
+                widget.after(self.FRAME_PERIOD, probe, time.perf_counter() + self.FRAME_PERIOD / 1000)
+        widget.after(self.FRAME_PERIOD, probe, time.perf_counter() + self.FRAME_PERIOD / 1000)
+        return
+
+    def start(self) -> None:
+        self.thread.start()
+        return
+
+    def stop(self) -> None:
+        self._stop.set()
+        return
+
+    def snapshot(self) -> tuple[dict[str, float], dict[str, float]]:
+        '''
+        :return: The latest gauges and rates, and the CPU use of every thread in [%]
+        :rtype: tuple[dict[str, float], dict[str, float]]
+        '''
+        with self.lock:
+            return dict(self.values), dict(self.thread_cpu)
+
+
+    ### INTERNAL FUNCTIONS
+    def _run(self) -> None:
+        t_last = time.perf_counter()
+        totals = {name: self._read(read) for name, read in self.counters.items()}
+        cpu_last = thread_cpu_times()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            elapsed = now - t_last
+            t_last = now
+
+            values = {name: self._read(read) for name, read in self.gauges.items()}
+            for name, read in self.counters.items():
+                total = self._read(read)
+                values[name + "/s"] = (total - totals.get(name, total)) / elapsed
+                totals[name] = total
+
+            cpu = thread_cpu_times()
+            thread_cpu = {}
+            for native_id, (name, cpu_time) in cpu.items():
+                previous = cpu_last.get(native_id, (name, cpu_time))[1]
+                thread_cpu[f"{name} ({native_id})"] = (cpu_time - previous) / elapsed * 100
+            cpu_last = cpu
+
+            if self._watching_tk:
+                with self.lock:
+                    latency, self._frame_latency = self._frame_latency, []
+                values["frame latency mean [ms]"] = sum(latency) / len(latency) * 1000 if latency else float("nan")
+                values["frame latency max [ms]"] = max(latency) * 1000 if latency else float("nan")
+
+            with self.lock:
+                self.values = values
+                self.thread_cpu = thread_cpu
+        return
+
+    def _read(self, read:Callable[[], float]) -> float:
+        try:
+            return float(read())
+        except Exception:
+            return float("nan")
+
+
+class SamplingProfiler:
+    """
+    Wall-clock sampling profiler of all threads.\r
+    Every interval the stacks of all threads are taken from sys._current_frames() and counted.
+    The result is written in the collapsed stack format ("thread;file:function;... count" per line)
+    that flamegraph.pl and speedscope read. Waiting threads are sampled too, in their wait call.
+    Every sample walks all stacks while holding the GIL, so the interval is kept coarse;
+    the CPU time the sampling thread itself uses is kept in cpu_time.
+    """
+
+    # CONSTANT
+    INTERVAL = 0.02             #[s] time between samples
+    MIN_INTERVAL = 0.01         #[s]
+
+    def __init__(self, interval:float = INTERVAL, file_name:str|None = None) -> None:
+        if interval < self.MIN_INTERVAL:
+            raise ValueError(f"interval should be at least {self.MIN_INTERVAL} s.")
+        if file_name is None:
+            os.makedirs(PROFILE_FOLDER, exist_ok=True)
+            file_name = PROFILE_FOLDER + f"/profile_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.folded"
+        self.interval = interval
+        self.file_name = file_name
+        self.samples = 0
+        self.cpu_time = 0.0         # [s] used by the sampling thread
+        self.stacks = collections.Counter()
+        self._stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True, name="SamplingProfiler")
+
+    ### EXTERNAL FUNCTIONS
+    def start(self) -> None:
+        self.thread.start()
+        return
+
+    def stop(self) -> str:
+        '''
+        Stop sampling and write the profile.
+
+        :return: The name of the written file
+        :rtype: str
+        '''
+        self._stop.set()
+        self.thread.join()
+        with open(self.file_name, 'w') as newfile:
+            for stack, count in self.stacks.most_common():
+                newfile.write(f"{stack} {count}\n")
+        return self.file_name
+
+
+    ### INTERNAL FUNCTIONS
+    def _run(self) -> None:
+        own = threading.get_ident()
+        names = {}
+        next_time = time.perf_counter()
+        cpu_start = time.thread_time()
+        while not self._stop.is_set():
+            if self.samples % 100 == 0:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+            self.cpu_time = time.thread_time() - cpu_start
+
+            next_time += self.interval
+            self._stop.wait(max(0.0, next_time - time.perf_counter()))
+        return
+
+
+if __name__ == "__main__":
+    import tempfile
+    import API_rotation_chair
+    from keshner_motion import KeshnerMotion
+    from simulated_drive import SimulatedDrive
+
+    # Overhead of the instrumentation on a simulated motion
+    drive = SimulatedDrive(timeout=0.05)
+    stream = API_rotation_chair.jogging_table(KeshnerMotion(0.01, total_time=5).exact_positions(), 0.01)
+
+    def reader() -> None:
+        while drive.is_open:
+            drive.readline()
+    threading.Thread(target=reader, daemon=True, name="reader").start()
+
+    def motion() -> float:
+        next_time = time.perf_counter()
+        late = 0.0
+        for command in stream:
+            drive.write((command + '\r').encode('ascii'))
+            late = max(late, time.perf_counter() - next_time)
+            next_time += 0.01
+            while time.perf_counter() < next_time:  pass
+        return late
+
+    late_bare = motion()
+
+    diagnostics = Diagnostics(interval=0.5)
+    diagnostics.add_counter("commands out", lambda: len(drive.received))
+    diagnostics.start()
+    profiler = SamplingProfiler(file_name=os.path.join(tempfile.mkdtemp(), "profile_demo.folded"))
+    profiler.start()
+    late_profiled = motion()
+    file_name = profiler.stop()
+    diagnostics.stop()
+
+    values, thread_cpu = diagnostics.snapshot()
+    print(f"Max send delay: {late_bare*1000:.3f} ms bare, {late_profiled*1000:.3f} ms with diagnostics and profiler")
+    print(", ".join(f"{k} {v:.1f}" for k, v in values.items()))
+    for name, cpu in sorted(thread_cpu.items(), key=lambda item: -item[1]):
+        print(f"\t{name}: {cpu:.1f} % CPU")
+    print(f"{profiler.samples} samples, {len(profiler.stacks)} stacks written to {file_name}, "
+          f"{profiler.cpu_time*1000:.1f} ms CPU of the profiler")
+    drive.close()
@@ -0,0 +1,156 @@
+import time
+from dataclasses import dataclass, field
+
+import numpy as np
+
+import API_rotation_chair
+from keshner_motion import KeshnerMotion, SumOfSinesMotion
+
+
+@dataclass
+class FeasibilityReport:
+    sampling_time: float                    # [s]
+    acc_limit: float                        # [deg/s^2] as executed by the drive
+    dec_limit: float                        # [deg/s^2] as executed by the drive
+    peak_speed: float                       # [deg/s] of the quantised commands
+    peak_acc: float                         # [deg/s^2] needed to reach every command within one tick
+    max_tracking_error: float               # [deg] executed angle vs reference angle
+    final_tracking_error: float             # [deg]
+    max_quantisation_error: float           # [deg] executed angle with vs without rpm rounding
+    final_quantisation_error: float         # [deg]
+    max_count_truncation: float             # [deg] lost by flooring the reference angle to counts
+    acc_violations: list[float] = field(default_factory=list)      # [s] start of ticks exceeding acc/dec
+    speed_violations: list[float] = field(default_factory=list)    # [s] start of ticks exceeding max_speed
+    analysis_time: float = 0.0              # [s]
+
+    @property
+    def feasible(self) -> bool:
+        return not self.acc_violations and not self.speed_violations
+
+    def summary(self) -> list[str]:
+        lines = [
+            f"Peak speed {self.peak_speed:.2f} deg/s, peak acc {self.peak_acc:.1f} deg/s^2 "
+            f"(limits {self.acc_limit:.1f}/{self.dec_limit:.1f})",
+            f"Tracking error max {self.max_tracking_error:.4f} deg, end {self.final_tracking_error:.4f} deg",
+            f"Quantisation error max {self.max_quantisation_error:.4f} deg, end {self.final_quantisation_error:.4f} deg, "
+            f"count truncation {self.max_count_truncation:.6f} deg",
+        ]
+        if self.acc_violations:
+            lines.append(f"{len(self.acc_violations)} ticks exceed acc/dec, first at t={self.acc_violations[0]:.2f} s")
+        if self.speed_violations:
+            lines.append(f"{len(self.speed_violations)} ticks exceed max speed, first at t={self.speed_violations[0]:.2f} s")
+        lines.append(f"Analysed in {self.analysis_time*1000:.1f} ms")
+        return lines
+
+
+def check_feasibility(motion:SumOfSinesMotion,
+                      acc_limit:float,
+                      dec_limit:float|None = None,
+                      max_speed:float|None = None) -> FeasibilityReport:
+    '''
+    Predict how the drive executes the jog stream of a motion before it is run.\r
+    Every tick the velocity command is rounded like jogging_table and the drive ramps towards it
+    with the acc/dec limits (rounded the same way by API_rotation_chair.acc/dec).
+
+    :param motion: The motion jogged through its exact_positions(), one command every sampling_time
+    :type motion: SumOfSinesMotion
+    :param acc_limit: Acceleration limit in [deg/s^2], as given to change_acc
+    :type acc_limit: float
+    :param dec_limit: Deceleration limit in [deg/s^2]. None for the same as acc_limit.
+    :type dec_limit: float | None
+    :param max_speed: Maximum allowed speed in [deg/s]. None for no check.
+    :type max_speed: float | None
+    :raises ValueError: If acc_limit or dec_limit is not positive once rounded like the drive
+    :rtype: FeasibilityReport
+    '''
+    t_start = time.perf_counter()
+    if dec_limit is None:
+        dec_limit = acc_limit
+
+    dt = motion.sampling_time
+    t = np.asarray(motion.time)
+    position = motion.exact_positions()
+    speed = np.diff(np.append(position[1:], 2 * position[-1] - position[-2]), prepend=position[0]) / dt   # unrounded step velocities
+    speed_q = API_rotation_chair.rpm2degs(API_rotation_chair.quantised_rpm_table(position, dt))
+    acc, dec = API_rotation_chair.rpm2degs(API_rotation_chair.degs2rpm([acc_limit, dec_limit])).tolist()
+    if acc <= 0 or dec <= 0:
+        raise ValueError(f"acc_limit and dec_limit should be positive once rounded to 0.01 rpm/s, got {acc_limit} and {dec_limit}.")
+
+    executed, reachable = _rate_limited_angle(speed_q, dt, acc, dec)
+    executed_ideal, _ = _rate_limited_angle(speed, dt, acc, dec)
+
+    reference = np.concatenate([[0.0], position[1:] - position[0]])
+    tracking = executed - reference
+    quantisation = executed - executed_ideal
+    truncation = position - API_rotation_chair.counts2deg(API_rotation_chair.deg2counts(position, rounding="floor"))
+
+    required = np.abs(np.diff(speed_q, prepend=0.0)) / dt
+    over_speed = np.zeros(len(t), dtype=bool) if max_speed is None else np.abs(speed_q) > max_speed
+
+    return FeasibilityReport(
+        sampling_time=dt,
+        acc_limit=acc,
+        dec_limit=dec,
+        peak_speed=float(np.abs(speed_q).max()),
+        peak_acc=float(required.max()),
+        max_tracking_error=float(np.abs(tracking).max()),
+        final_tracking_error=float(tracking[-1]),
+        max_quantisation_error=float(np.abs(quantisation).max()),
+        final_quantisation_error=float(quantisation[-1]),
+        max_count_truncation=float(truncation.max()),
+        acc_violations=t[~reachable].tolist(),
+        speed_violations=t[over_speed].tolist(),
+        analysis_time=time.perf_counter() - t_start)
+
+
+def _rate_limited_angle(command:np.ndarray, dt:float, acc:float, dec:float) -> tuple[np.ndarray, np.ndarray]:
+    '''
+    Angle executed at the start of every tick when command[k] is jogged during tick k from standstill.\r
+    Assumes every command is reached within its tick, which is exact and vectorized for the feasible parts;
+    only the stretches where the drive saturates are stepped through one tick at a time.
+
+    :return: The executed angle in [deg] and whether each command was reached within its tick
+    :rtype: tuple[np.ndarray, np.ndarray]
+    '''
+    n = len(command)
+    start = np.concatenate([[0.0], command[:-1]])       # velocity at the start of each tick
+    end = command.astype(float)                         # velocity at the end of each tick
+    reachable = np.ones(n, dtype=bool)
+
+    def limit(v0:np.ndarray, v1:np.ndarray) -> np.ndarray:
+        speeding_up = (v1 - v0) * v0 >= 0
+        return np.where(speeding_up, acc, dec)
+
+    k = 0
+    while k < n:
+        delta = command[k:] - start[k:]
+        over = np.nonzero(np.abs(delta) > limit(start[k:], command[k:]) * dt)[0]
+        if len(over) == 0:
+            break
+        k += over[0]
+
+        # saturated: step until the executed velocity has caught up with the command again
+        while k < n:
+            v = start[k]
+            step = limit(start[k:k+1], command[k:k+1])[0] * dt
+            if abs(command[k] - v) <= step:
+                break
+            reachable[k] = False
+            end[k] = v + np.sign(command[k] - v) * step
+            k += 1
+            if k < n:
+                start[k] = end[k-1]
+
+    # reachable ticks: ramp to the command, then hold; saturated ticks: ramp the whole tick
+    ramp_time = np.where(reachable, np.abs(end - start) / limit(start, end), dt)
+    angle = (start + end) / 2 * ramp_time + end * (dt - ramp_time)
+
+    return np.concatenate([[0.0], np.cumsum(angle)[:-1]]), reachable
+
+
+if __name__ == "__main__":
+    for delta_t in [0.02, 0.1]:
+        report = check_feasibility(KeshnerMotion(delta_t), 360*6)
+        print(f"delta_t = {delta_t} s, feasible: {report.feasible}")
+        for line in report.summary():
+            print("\t" + line)
@@ -1,39 +1,99 @@
 from math import sin, cos, pi
 from time import sleep
+import hashlib
+import json
+import os
+import tempfile
+import warnings
+import zipfile
+
+import numpy as np
+
+
+class SumOfSinesMotion:
+    """
+    A general sum-of-sines stimulus.\r
+    speed(t) = sum(A_i * sin(2*pi*f_0*h_i*(t + t_s) + d_i))\r
+    The time shift t_s is solved numerically so that the motion starts from speed(0)=0,
+    and the generated tables are cached on disk so the same condition loads instantly next time.
+    """
 
-class KeshnerMotion:
-    
     # CONSTANT
     FUNDAMENTAL_FREQ = 0.005    #[Hz]
-    HOMONICS = [37, 49, 71, 101, 143, 211, 295, 419, 589, 823, 1031, 1741]
-    ANG_SPEED_HOMONICS = [18, 18, 18, 17, 17, 17, 15, 15, 13, 12, 9, 7]   #[deg/s]
     TIME_TOTAL = 200            #[s] default total time of the motion
-    TIME_SHIFT = 389.5059811086086       #[s] to make speed(0)=0
+    CACHE_FOLDER = "../Motion Cache"
+    CACHE_VERSION = 1           #[-] raise when the generation of the tables changes, old caches are ignored
+    SHIFT_GRID_DENSITY = 20     #[-] grid points per period of the highest harmonic when searching t_s
 
-    def __init__(self, sampling_time:float = 0.5, total_time:float = TIME_TOTAL) -> None:
+    def __init__(self,
+                 harmonics:list[int],
+                 amplitudes:list[float],
+                 phases:list[float]|None = None,
+                 sampling_time:float = 0.5,
+                 total_time:float = TIME_TOTAL,
+                 fundamental_freq:float = FUNDAMENTAL_FREQ,
+                 time_shift:float|None = None,
+                 use_cache:bool = True) -> None:
+        """
+        :param harmonics: Harmonic numbers h_i of the fundamental frequency
+        :type harmonics: list[int]
+        :param amplitudes: Velocity amplitude A_i of each harmonic in [deg/s]
+        :type amplitudes: list[float]
+        :param phases: Phase d_i of each harmonic in [rad]. None for all zeros.
+        :type phases: list[float] | None
+        :param time_shift: Fixed t_s in [s]. None to solve for speed(0)=0.
+        :type time_shift: float | None
+        :param use_cache: Load/save the generated tables from/to CACHE_FOLDER
+        :type use_cache: bool
+        """
+        if len(harmonics) != len(amplitudes):
+            raise ValueError("harmonics and amplitudes should have the same length.")
+        if phases is None:
+            phases = [0.0] * len(harmonics)
+        if len(phases) != len(harmonics):
+            raise ValueError("harmonics and phases should have the same length.")
+
+        self.HOMONICS = list(harmonics)
+        self.ANG_SPEED_HOMONICS = list(amplitudes)
+        self.PHASES = [float(d) for d in phases]
+        self.FUNDAMENTAL_FREQ = fundamental_freq
         self.TIME_TOTAL = total_time
+        self.use_cache = use_cache
+        self._fixed_time_shift = time_shift
+        self.TIME_SHIFT = time_shift
         self.reset_sampling_time(sampling_time)
 
     ### EXTERNAL FUNCTIONS
     def next_step(self, i:int) -> tuple[int, float, float]:
-        if i==len(self.time):
-            i = -1
-        else:
-            i_next = i+1
-        return (i_next, self.time[i], self.speed_table[i])
-    
+        """
+        The time and speed of step i, and the index of the step after it.
+        Past the end of the table the last step is held: its time and speed, with the end as next index.
+
+        :return: (next index, time in [s], speed in [deg/s])
+        :rtype: tuple[int, float, float]
+        """
+        if i >= len(self.time):
+            return (len(self.time), self.time[-1], self.speed_table[-1])
+        return (i + 1, self.time[i], self.speed_table[i])
+
     def reset_sampling_time(self, sampling_time:float) -> None:
         self.sampling_time = sampling_time
+        if self.use_cache and self._load_cache():
+            return
+        if self.TIME_SHIFT is None:
+            self.TIME_SHIFT = self._solve_time_shift()
         self._generate_time_table()
         self._generate_speed_table()
         self._generate_position_table()
+        if self.use_cache:
+            self._save_cache()
         return
 
     def position(self, t:float) -> float:
         """
         Calculate the position at a certain time.
         By adding all the influeces from each sinusoidal signal.
-        ans = sum(-A_i * cos(2*pi*f_i*t + d_i) / (2*pi*f_i)) for i = 0 to 9
+        ans = sum(-A_i * cos(2*pi*f_i*t + d_i) / (2*pi*f_i))
         :param t: The time of the query in [s]
         :type t: float
         :return: The position in [deg]
@@ -42,41 +102,200 @@ class KeshnerMotion:
 
         ans = 0.0
         t = t + self.TIME_SHIFT
-        for i in range(len(self.HOMONICS)):
-            A_i = self.ANG_SPEED_HOMONICS[i]
-            f_i_rad = 2 * pi * self.FUNDAMENTAL_FREQ * self.HOMONICS[i]
-            ans = ans - A_i * cos(f_i_rad*t) / f_i_rad
+        for A_i, h_i, d_i in zip(self.ANG_SPEED_HOMONICS, self.HOMONICS, self.PHASES):
+            f_i_rad = 2 * pi * self.FUNDAMENTAL_FREQ * h_i
+            ans = ans - A_i * cos(f_i_rad*t + d_i) / f_i_rad
 
         return round(ans,2)
-    
+
     def speed(self, t:float) -> float:
         """
         Calculate the speed at a certain time.
         By adding all the influeces from each sinusoidal signal.
-        ans = sum(A_i * sin(2*pi*f_i*t + d_i)) for i = 0 to 9
+        ans = sum(A_i * sin(2*pi*f_i*t + d_i))
         :param t: The time of the query in [s]
         :type t: float
         :return: The position in [deg/s]
         :rtype: float
         """
         t = t + self.TIME_SHIFT
-        ans = sum([A*sin(2*pi*h*self.FUNDAMENTAL_FREQ*t) for A, h in zip(self.ANG_SPEED_HOMONICS, self.HOMONICS)])
+        ans = sum([A*sin(2*pi*h*self.FUNDAMENTAL_FREQ*t + d) for A, h, d in zip(self.ANG_SPEED_HOMONICS, self.HOMONICS, self.PHASES)])
 
         return round(ans,2)
-    
 
-    ### INTERNAL FUNCTIONS  
+    def cache_key(self) -> str:
+        """
+        The key of the cached tables, unique for the stimulus parameters and the sampling time.
+        """
+        parameters = {
+            "version": self.CACHE_VERSION,
+            "harmonics": self.HOMONICS,
+            "amplitudes": self.ANG_SPEED_HOMONICS,
+            "phases": self.PHASES,
+            "fundamental_freq": self.FUNDAMENTAL_FREQ,
+            "total_time": self.TIME_TOTAL,
+            "time_shift": self._fixed_time_shift,
+            "sampling_time": self.sampling_time,
+        }
+        return hashlib.sha1(json.dumps(parameters, sort_keys=True).encode("ascii")).hexdigest()[:16]
+
+    def exact_positions(self) -> np.ndarray:
+        """
+        The positions at the times of the table, without the 0.01 deg rounding of position_table.\r
+        Command streams are built from these: the differences of the rounded table would turn
+        its rounding into acceleration spikes.
+
+        :return: The position at each time of the table in [deg]
+        :rtype: np.ndarray
+        """
+        return self._position_array(np.asarray(self.time))
+
+
+    ### INTERNAL FUNCTIONS
+    def _speed_array(self, t:np.ndarray, shifted:bool = True) -> np.ndarray:
+        w = 2 * pi * self.FUNDAMENTAL_FREQ * np.asarray(self.HOMONICS, dtype=float)
+        if shifted:
+            t = t + self.TIME_SHIFT
+        phase = np.outer(t, w) + np.asarray(self.PHASES)
+        return np.sin(phase) @ np.asarray(self.ANG_SPEED_HOMONICS, dtype=float)
+
+    def _acc_array(self, t:np.ndarray) -> np.ndarray:
+        w = 2 * pi * self.FUNDAMENTAL_FREQ * np.asarray(self.HOMONICS, dtype=float)
+        phase = np.outer(t, w) + np.asarray(self.PHASES)
+        return np.cos(phase) @ (np.asarray(self.ANG_SPEED_HOMONICS, dtype=float) * w)
+
+    def _position_array(self, t:np.ndarray) -> np.ndarray:
+        w = 2 * pi * self.FUNDAMENTAL_FREQ * np.asarray(self.HOMONICS, dtype=float)
+        phase = np.outer(t + self.TIME_SHIFT, w) + np.asarray(self.PHASES)
+        return -np.cos(phase) @ (np.asarray(self.ANG_SPEED_HOMONICS, dtype=float) / w)
+
+    def _solve_time_shift(self, guess:float|None = None) -> float:
+        '''
+        Find t_s within one fundamental period so that speed(0)=0.\r
+        All sign changes of the speed on a fine grid are refined by bisection at once.
+        The root closest to the guess is taken, or, without a guess, the one with the smallest
+        acceleration so the chair starts as gently as possible.
+
+        :param guess: A preferred time shift in [s]
+        :type guess: float | None
+        :return: The time shift in [s]
+        :rtype: float
+        '''
+        period = 1 / self.FUNDAMENTAL_FREQ
+        step = 1 / (self.SHIFT_GRID_DENSITY * self.FUNDAMENTAL_FREQ * max(self.HOMONICS))
+        grid = np.arange(0.0, period + step, step)
+        v = self._speed_array(grid, shifted=False)
+
+        brackets = np.nonzero(np.signbit(v[:-1]) != np.signbit(v[1:]))[0]
+        if len(brackets) == 0:
+            return 0.0
+
+        lo, hi = grid[brackets], grid[brackets + 1]
+        v_lo = v[brackets]
+        for _ in range(60):
+            mid = (lo + hi) / 2
+            v_mid = self._speed_array(mid, shifted=False)
+            same_side = np.signbit(v_mid) == np.signbit(v_lo)
+            lo = np.where(same_side, mid, lo)
+            v_lo = np.where(same_side, v_mid, v_lo)
+            hi = np.where(same_side, hi, mid)
+        roots = (lo + hi) / 2
+
+        if guess is not None:
+            distance = np.abs((roots - guess + period / 2) % period - period / 2)
+            best = roots[np.argmin(distance)]
+            return float(best + round((guess - best) / period) * period)
+        return float(roots[np.argmin(np.abs(self._acc_array(roots)))])
+
     def _generate_time_table(self) -> None:
-        self.time = [self.sampling_time * i for i in range(int(self.TIME_TOTAL // self.sampling_time)+1)]
+        n_steps = int(round(self.TIME_TOTAL / self.sampling_time, 9) // 1)
+        self.time = (self.sampling_time * np.arange(n_steps + 1)).tolist()
         return
-    
+
     def _generate_speed_table(self) -> None:
-        self.speed_table = [self.speed(t) for t in self.time]
+        self.speed_table = np.round(self._speed_array(np.asarray(self.time)), 2).tolist()
         return
-    
+
     def _generate_position_table(self) -> None:
-        self.position_table = [self.position(t) for t in self.time]
-    
+        self.position_table = np.round(self._position_array(np.asarray(self.time)), 2).tolist()
+        return
+
+    def _cache_file(self) -> str:
+        return os.path.join(self.CACHE_FOLDER, f"{type(self).__name__}_{self.cache_key()}.npz")
+
+    def _load_cache(self) -> bool:
+        try:
+            with np.load(self._cache_file()) as cached:
+                self.time = cached["time"].tolist()
+                self.speed_table = cached["speed"].tolist()
+                self.position_table = cached["position"].tolist()
+                self.TIME_SHIFT = float(cached["time_shift"])
+        except (OSError, KeyError, ValueError, EOFError, zipfile.BadZipFile):
+            return False        # missing, or truncated by a crash while saving: generate again
+        return True
+
+    def _save_cache(self) -> None:
+        # written to a temporary file first and renamed, so a crash never leaves a half-written cache
+        temp_name = None
+        try:
+            os.makedirs(self.CACHE_FOLDER, exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=self.CACHE_FOLDER, suffix=".tmp", delete=False) as temp:
+                temp_name = temp.name
+                np.savez(temp, time=self.time, speed=self.speed_table, position=self.position_table, time_shift=self.TIME_SHIFT)
+            os.replace(temp_name, self._cache_file())
+        except OSError as e:
+            warnings.warn(f"Motion cache not saved: {e}", RuntimeWarning)
+            if temp_name and os.path.exists(temp_name):
+                os.remove(temp_name)
+        return
+
+
+class KeshnerMotion(SumOfSinesMotion):
+    """
+    The sum-of-sines stimulus of Keshner & Peterson (1995).\r
+    The 12 harmonics are split into 3 bands of 4 (low, middle, high) for the partial motions.
+    """
+
+    # CONSTANT
+    FUNDAMENTAL_FREQ = 0.005    #[Hz]
+    HOMONICS = [37, 49, 71, 101, 143, 211, 295, 419, 589, 823, 1031, 1741]
+    ANG_SPEED_HOMONICS = [18, 18, 18, 17, 17, 17, 15, 15, 13, 12, 9, 7]   #[deg/s]
+    TIME_TOTAL = 200            #[s] default total time of the motion
+    TIME_SHIFT = 389.5059811086086       #[s] initial guess to make speed(0)=0
+    BANDS = (slice(0, 4), slice(4, 8), slice(8, 12))
+
+    def __init__(self,
+                 sampling_time:float = 0.5,
+                 total_time:float = TIME_TOTAL,
+                 bands:tuple[bool, bool, bool] = (True, True, True),
+                 phases:list[float]|None = None,
+                 use_cache:bool = True) -> None:
+        """
+        :param bands: Which of the 1st/2nd/3rd frequency bands are included in the motion
+        :type bands: tuple[bool, bool, bool]
+        :param phases: Phase of each of the 12 harmonics in [rad]. None for all zeros.
+        :type phases: list[float] | None
+        """
+        if not any(bands):
+            raise ValueError("At least one frequency band should be selected.")
+        if phases is None:
+            phases = [0.0] * len(KeshnerMotion.HOMONICS)
+
+        selected = [i for band, on in zip(self.BANDS, bands) if on for i in range(len(KeshnerMotion.HOMONICS))[band]]
+        self.bands = tuple(bool(b) for b in bands)
+        self._time_shift_guess = KeshnerMotion.TIME_SHIFT
+
+        super().__init__(
+            harmonics=[KeshnerMotion.HOMONICS[i] for i in selected],
+            amplitudes=[KeshnerMotion.ANG_SPEED_HOMONICS[i] for i in selected],
+            phases=[phases[i] for i in selected],
+            sampling_time=sampling_time,
+            total_time=total_time,
+            use_cache=use_cache)
+
+    def _solve_time_shift(self, guess:float|None = None) -> float:
+        return super()._solve_time_shift(self._time_shift_guess if guess is None else guess)
+
 
 if __name__ == "__main__":
     test = KeshnerMotion()
@@ -86,4 +305,4 @@ if __name__ == "__main__":
         now_speed = test.speed(t_now)
         print(f"t={t_now}, theta_i={round(distance,2)}, theta_c={test.position(t_now)}, w={now_speed}")
         distance += now_speed*0.1
-        sleep(0.1)
\ No newline at end of file
+        sleep(0.1)
@@ -0,0 +1,197 @@
+import re
+import threading
+import time
+
+
+BAUD_RATES = (921600, 460800, 230400, 115200)
+BAUD_COMMAND = "baud {rate}"    # NOT verified on the drive: the "Fast link" button stays out of the UI until it is
+PROMPT = "-->"
+NUMBER = re.compile(r"(?<![\w.])[-+]?\d+\.\d*")
+ABSOLUTE_COMMANDS = ("j", "moveabs", "acc", "dec")       # a repeat of these changes nothing
+ECHO_BUDGET = 0.5               # [-] share of the line capacity the stream may use with the echo on
+
+
+def compact_command(command:str) -> str:
+    '''
+    Shortest equivalent form of a command: single spaces, and decimals without trailing zeros
+    ("j 1.50" -> "j 1.5", "j -0.0" -> "j 0").
+    '''
+    def shorten(match:re.Match) -> str:
+        number = match.group(0).rstrip("0").rstrip(".")
+        if number in ("-0", "+0", "-", "+", ""):
+            return "0"
+        return number.lstrip("+")
+    return NUMBER.sub(shorten, " ".join(command.split()))
+
+
+def compact_stream(commands:list[str]) -> list[str|None]:
+    '''
+    Compact a stream of commands sent one per time step: every command is shortened and
+    a command equal to the previous one is replaced by None (nothing to send), but only for the commands
+    that set an absolute value (ABSOLUTE_COMMANDS): the drive keeps jogging at the last velocity anyway.
+    A relative command such as moveinc adds up, so every repeat is kept.
+    '''
+    stream = []
+    previous = None
+    for command in commands:
+        command = compact_command(command)
+        absolute = command.split(" ", 1)[0].lower() in ABSOLUTE_COMMANDS
+        stream.append(None if absolute and command == previous else command)
+        previous = command
+    return stream
+
+
+def stream_needs_quiet(commands:list[str|None], delta_t:float, baudrate:int) -> bool:
+    '''
+    Whether the echo has to be switched off for a stream: with the echo on, every command is sent back,
+    which doubles the traffic from the drive. True if that would use more than ECHO_BUDGET of the line.
+    '''
+    sent = [c for c in commands if c is not None]
+    if not sent:
+        return False
+    bytes_per_tick = sum(len(c) + 1 for c in sent) / len(commands)
+    capacity = baudrate / 10 * delta_t          # 8N1: 10 bits per byte
+    return (2 * bytes_per_tick + len(PROMPT) + 2) > ECHO_BUDGET * capacity
+
+
+class AckCounter:
+    """
+    Acknowledgement of the commands sent with the echo off: the drive still answers every command
+    with its prompt, so the prompts received are counted against the commands sent.
+    """
+
+    def __init__(self) -> None:
+        self.sent = 0
+        self.acknowledged = 0
+        self.lock = threading.Lock()
+
+    def on_send(self) -> None:
+        with self.lock:
+            self.sent += 1
+        return
+
+    def on_line(self, line:str) -> None:
+        if line.startswith(PROMPT):
+            with self.lock:
+                self.acknowledged += 1
+        return
+
+    @property
+    def outstanding(self) -> int:
+        return self.sent - self.acknowledged
+
+
+def measure_bandwidth(port, n_commands:int = 200, command:str = "") -> dict[str, float]:
+    '''
+    Effective command bandwidth: send n_commands one after the other, each after the prompt of the previous one.
+
+    :param port: An open serial.Serial or SimulatedDrive, with nothing else reading from it
+    :param command: The command to send, "" for the bare prompt
+    :return: Commands per second, bytes per second both ways, and the round trip time in [ms]
+    :rtype: dict[str, float]
+    '''
+    port.reset_input_buffer()
+    data = (command + '\r').encode('ascii')
+    bytes_in = 0
+    t_start = time.perf_counter()
+    for _ in range(n_commands):
+        port.write(data)
+        while True:
+            line = port.readline()
+            if not line:
+                raise TimeoutError("No prompt from the drive.")
+            bytes_in += len(line)
+            if line.decode('ascii', errors='ignore').strip().startswith(PROMPT):
+                break
+    elapsed = time.perf_counter() - t_start
+    return {
+        "commands/s": n_commands / elapsed,
+        "bytes/s": (n_commands * len(data) + bytes_in) / elapsed,
+        "round trip [ms]": elapsed / n_commands * 1000,
+    }
+
+
+def negotiate_baud(port, rates:tuple[int, ...] = BAUD_RATES) -> int:
+    '''
+    Switch the drive and the port to the highest rate both support.\r
+    For every rate, the switch command is sent at the current rate, the port follows, and the drive must
+    answer a bare command with its prompt; otherwise both go back to the rate that worked.
+
+    :param port: An open serial.Serial or SimulatedDrive, with nothing else reading from it
+    :return: The rate in use afterwards
+    :rtype: int
+    '''
+    original = port.baudrate
+    for rate in rates:
+        if rate == port.baudrate:
+            return rate
+        if _switch(port, rate) and probe(port):
+            return rate
+        # back to the rate that worked: tell the drive at both rates, it listens at one of them
+        for listening in (rate, original):
+            port.baudrate = listening
+            port.write((BAUD_COMMAND.format(rate=original) + '\r').encode('ascii'))
+            time.sleep(0.05)
+        port.baudrate = original
+        port.reset_input_buffer()
+        if not probe(port):
+            raise ConnectionError(f"The drive does not answer at {original} baud any more.")
+    return port.baudrate
+
+
+def probe(port, attempts:int = 3) -> bool:
+    '''
+    Whether the drive answers a bare command with its prompt at the current rate of the port.
+
+    :param port: An open serial.Serial or SimulatedDrive, with nothing else reading from it
+    :param attempts: Bare commands sent before giving up
+    :type attempts: int
+    :rtype: bool
+    '''
+    for _ in range(attempts):
+        port.write(b'\r')
+        line = port.readline().decode('ascii', errors='ignore')
+        while line:
+            if line.strip().startswith(PROMPT):
+                return True
+            line = port.readline().decode('ascii', errors='ignore')
+    return False
+
+
+def _switch(port, rate:int) -> bool:
+    port.reset_input_buffer()
+    port.write((BAUD_COMMAND.format(rate=rate) + '\r').encode('ascii'))
+    port.flush()
+    time.sleep(0.05)            # let the drive finish answering at the old rate
+    port.baudrate = rate
+    port.reset_input_buffer()
+    return True
+
+
+if __name__ == "__main__":
+    import sys
+    import serial
+    import API_rotation_chair
+    from keshner_motion import KeshnerMotion
+    from simulated_drive import SimulatedDrive
+
+    # python link_optimizer.py [port]
+    if len(sys.argv) > 1:
+        port = serial.Serial(sys.argv[1], 115200, timeout=0.5)
+    else:
+        port = SimulatedDrive(timeout=0.5, emulate_baudrate=True, switches_baud=True)
+
+    jogs = API_rotation_chair.jogging_table(KeshnerMotion(0.005).exact_positions(), 0.005)
+    stream = compact_stream(jogs)
+    sent = [c for c in stream if c is not None]
+    print(f"Jog stream: {sum(len(c) + 1 for c in jogs)} bytes -> {sum(len(c) + 1 for c in sent)} bytes "
+          f"({len(jogs) - len(sent)} repeated commands skipped)")
+
+    port.write(b"echo 1\r")
+    before = measure_bandwidth(port, command="j 12.34")
+    port.write(b"echo 0\r")
+    rate = negotiate_baud(port)
+    after = measure_bandwidth(port, command="j 12.34")
+    print(f"Before (115200 baud, echo on): " + ", ".join(f"{k} {v:.1f}" for k, v in before.items()))
+    print(f"After ({rate} baud, echo off): " + ", ".join(f"{k} {v:.1f}" for k, v in after.items()))
+    port.close()
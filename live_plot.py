@@ -0,0 +1,197 @@
+import threading
+import time
+import tkinter as tk
+from tkinter import ttk
+
+import numpy as np
+
+
+class RingBuffer:
+    """
+    A fixed-size buffer of (time, value) samples, overwriting the oldest ones.\r
+    Appending is cheap enough to be done from the control thread every tick.
+    """
+
+    def __init__(self, size:int) -> None:
+        self.size = size
+        self.t = np.zeros(size)
+        self.value = np.zeros(size)
+        self.count = 0              # total number of samples ever appended
+        self.lock = threading.Lock()
+
+    def append(self, t:float, value:float) -> None:
+        with self.lock:
+            i = self.count % self.size
+            self.t[i] = t
+            self.value[i] = value
+            self.count += 1
+        return
+
+    def clear(self) -> None:
+        with self.lock:
+            self.count = 0
+        return
+
+    def snapshot(self, t_from:float) -> tuple[np.ndarray, np.ndarray]:
+        '''
+        Copy of the samples from t_from on, oldest first.
+        '''
+        with self.lock:
+            n = min(self.count, self.size)
+            start = self.count % self.size if self.count > self.size else 0
+            order = (np.arange(n) + start) % self.size
+            t, value = self.t[order], self.value[order]
+        keep = np.searchsorted(t, t_from)
+        return t[keep:], value[keep:]
+
+
+class LivePlot(ttk.Frame):
+    """
+    Scrolling plot of commanded vs measured velocity and angle.\r
+    Samples are pushed into ring buffers from any thread; the Tk thread redraws at most max_fps times
+    per second, and only when new samples arrived. Every pixel column is drawn as its min/max,
+    so the drawing cost depends on the plot width and not on the number of samples.
+    """
+
+    # CONSTANT
+    CHANNELS = {                # name: (panel, colour)
+        "cmd_speed": (0, "blue"),
+        "meas_speed": (0, "red"),
+        "cmd_angle": (1, "blue"),
+        "meas_angle": (1, "red"),
+    }
+    PANEL_LABELS = ("Velocity [deg/s]", "Angle [deg]")
+    MARGIN = 40                 #[px] left margin for the axis labels
+
+    def __init__(self, master, window:float = 20.0, max_fps:float = 20.0, buffer_size:int = 20000, height:int = 200) -> None:
+        """
+        :param window: Visible time span in [s]
+        :type window: float
+        :param max_fps: Maximum number of redraws per second
+        :type max_fps: float
+        :param buffer_size: Number of samples kept per channel
+        :type buffer_size: int
+        """
+        super().__init__(master)
+        self.window = window
+        self.period_ms = int(1000 / max_fps)
+        self.buffers = {name: RingBuffer(buffer_size) for name in self.CHANNELS}
+        self._drawn_counts = None
+        self.draw_time = 0.0        #[s] total time spent drawing
+
+        self.canvas = tk.Canvas(self, height=height, background="white", highlightthickness=0)
+        self.canvas.pack(fill="both", expand=True)
+        self.lines = {name: self.canvas.create_line(0, 0, 0, 0, fill=colour) for name, (_, colour) in self.CHANNELS.items()}
+        self.labels = [self.canvas.create_text(2, 0, anchor="nw", text="", font=("Helvetica", 8)) for _ in range(2 * len(self.PANEL_LABELS))]
+        self.titles = [self.canvas.create_text(self.MARGIN + 4, 0, anchor="nw", text=text, font=("Helvetica", 8)) for text in self.PANEL_LABELS]
+
+        self.after(self.period_ms, self._redraw)
+
+    ### EXTERNAL FUNCTIONS
+    def push(self, channel:str, t:float, value:float) -> None:
+        """
+        Add a sample to a channel. Thread-safe.
+
+        :param channel: One of CHANNELS
+        :param t: Time of the sample in [s]
+        :param value: Value of the sample in [deg/s] or [deg]
+        """
+        self.buffers[channel].append(t, value)
+        return
+
+    def clear(self) -> None:
+        for buffer in self.buffers.values():
+            buffer.clear()
+        return
+
+
+    ### INTERNAL FUNCTIONS
+    def _redraw(self) -> None:
+        try:
+            counts = [buffer.count for buffer in self.buffers.values()]
+            if counts != self._drawn_counts:
+                self._drawn_counts = counts
+                t_start = time.perf_counter()
+                self._draw()
+                self.draw_time += time.perf_counter() - t_start
+        finally:
+            self.after(self.period_ms, self._redraw)
+
+    def _draw(self) -> None:
+        width = self.canvas.winfo_width() - self.MARGIN
+        height = self.canvas.winfo_height() / len(self.PANEL_LABELS)
+        if width < 10 or height < 10:
+            return
+
+        t_end = max((buffer.t[(buffer.count - 1) % buffer.size] for buffer in self.buffers.values() if buffer.count), default=0.0)
+        t_start = t_end - self.window
+
+        traces = {name: _decimate(*self.buffers[name].snapshot(t_start), t_start, self.window, int(width)) for name in self.CHANNELS}
+
+        for panel in range(len(self.PANEL_LABELS)):
+            values = [traces[name][1] for name, (p, _) in self.CHANNELS.items() if p == panel and len(traces[name][1])]
+            low = min((v.min() for v in values), default=-1.0)
+            high = max((v.max() for v in values), default=1.0)
+            if high - low < 1e-6:
+                low, high = low - 1, high + 1
+            y_top = panel * height
+
+            self.canvas.coords(self.titles[panel], self.MARGIN + 4, y_top)
+            self.canvas.coords(self.labels[2*panel], 2, y_top)
+            self.canvas.itemconfig(self.labels[2*panel], text=f"{high:.0f}")
+            self.canvas.coords(self.labels[2*panel+1], 2, y_top + height - 12)
+            self.canvas.itemconfig(self.labels[2*panel+1], text=f"{low:.0f}")
+
+            for name, (p, _) in self.CHANNELS.items():
+                if p != panel:
+                    continue
+                x, y = traces[name]
+                if len(x) < 2:
+                    self.canvas.coords(self.lines[name], 0, 0, 0, 0)
+                    continue
+                px = self.MARGIN + x
+                py = y_top + (high - y) / (high - low) * (height - 2) + 1
+                self.canvas.coords(self.lines[name], *np.column_stack([px, py]).ravel().tolist())
+        return
+
+
+def _decimate(t:np.ndarray, value:np.ndarray, t_start:float, window:float, width:int) -> tuple[np.ndarray, np.ndarray]:
+    '''
+    Min/max decimation to pixel columns: every column with samples becomes two points, its min and max.
+
+    :return: x in [px] and the values, at most 2*width points
+    :rtype: tuple[np.ndarray, np.ndarray]
+    '''
+    if len(t) == 0:
+        return t, value
+    column = np.clip(((t - t_start) / window * width).astype(int), 0, width - 1)
+    if len(t) <= 2 * width:
+        return column.astype(float), value
+
+    starts = np.concatenate([[0], np.nonzero(np.diff(column))[0] + 1])
+    low = np.minimum.reduceat(value, starts)
+    high = np.maximum.reduceat(value, starts)
+    x = np.repeat(column[starts].astype(float), 2)
+    y = np.column_stack([low, high]).ravel()
+    return x, y
+
+
+if __name__ == "__main__":
+    import time
+
+    root = tk.Tk()
+    plot = LivePlot(root)
+    plot.pack(fill="both", expand=True)
+    t_zero = time.time()
+
+    def feed() -> None:
+        # 50 Hz commands and noisy readbacks, as in a Keshner run
+        while True:
+            t = time.time() - t_zero
+            plot.push("cmd_speed", t, 60 * np.sin(t))
+            plot.push("meas_speed", t, 60 * np.sin(t - 0.1) + np.random.randn())
+            plot.push("cmd_angle", t, -60 * np.cos(t))
+            time.sleep(0.02)
+
+    threading.Thread(target=feed, daemon=True).start()
+    root.mainloop()
@@ -1,5 +1,6 @@
 # Python Ver:   3.13.0
 # Pyserial Ver: 3.5
+# Numpy Ver:    2.x
 
 import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox
@@ -8,34 +9,101 @@ import serial.tools.list_ports
 import threading
 import time
 import datetime
-from keshner_motion import KeshnerMotion
+import collections
+from keshner_motion import KeshnerMotion, SumOfSinesMotion
+import phase_optimizer
+from feasibility import check_feasibility
+from live_plot import LivePlot
+from rolling_record import RollingRecorder, load_record
+import telemetry
+from simulated_drive import SimulatedDrive
+from connection_watchdog import ConnectionWatchdog, find_port, port_identity
+import link_optimizer
+from safety_supervisor import SafetySupervisor
+from trial_database import TrialDatabase, record_metrics
+from diagnostics import Diagnostics, SamplingProfiler
 import API_rotation_chair
 
 
 TEST_MODE = False
+BAUDRATE = 115200
+SERIAL_TIMEOUT = 1          # [s]
+MOTION_ACC = 360*6      # [deg/s^2] acc/dec limit while tracking a motion
+ROLLING_RECORD_TIME = 0.01  # [s] sampling time of the rolling record during a motion
+CMD_HISTORY_SIZE = 200      # number of typed commands kept for the Up/Down keys
+MAX_SPEED = 180             # [deg/s] safety envelope: commanded and measured speed
+MAX_ANGLE = 360*25          # [deg] safety envelope: net angle of a motion
 
 
 class VarComInterface:
     def __init__(self, root):
         self.root = root
         self.root.title("VarCom Motor Controller Interface")
-        self.root.geometry("800x600")
+        self.root.geometry("800x800")
         
         self.serial_port = None
         self.connected = False
+        self.port_name = None
+        self.port_identity = (None, None, None)
+        self.baudrate = BAUDRATE
+        self.ack = link_optimizer.AckCounter()
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.lines_in = 0
+        self.watchdog = None
+        self.awaiting = collections.deque()     # one entry per command not answered yet: whether it is a watchdog probe
+        self.motion_thread = None
+        self.write_lock = threading.Lock()
+        self.supervisor = SafetySupervisor(
+            write=self._write_stop,
+            write_lock=self.write_lock,
+            max_speed=MAX_SPEED,
+            max_angle=MAX_ANGLE,
+            on_stop=self._on_safety_stop,
+            poll=self._poll_readbacks)
 
         self.getting_record = False
+        self.link_busy = False
         self.getting_speed = False
         self.quiet = False
         self.motor_active = False
+        self.opmode = None
+        self.acc_value = None
 
         self.speed = 0.0
+        self.angle_zero = None      # [counts] first position readback of a motion
+        self.t_motion_start = time.time()
 
-        self.cmd_history = []
+        self.cmd_history = collections.deque(maxlen=CMD_HISTORY_SIZE)
         self.cmd_rollback = 0
+
+        self.telemetry = telemetry.TelemetryLog()
+        self.trials = TrialDatabase()
+        self.preflight_report = None
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         
         # Create GUI elements
         self.create_widgets()
+
+        # Instrumentation for the diagnostics panel
+        self.terminal_time = 0.0    # [s] total time spent in log_terminal
+        self.profiler = None
+        self.profiler_cpu_time = 0.0    # [s] used by the finished profiles
+        self.profile_interval = tk.IntVar(value=round(SamplingProfiler.INTERVAL * 1000))   # [ms]
+        self.diagnostics_window = None
+        self.diagnostics = Diagnostics()
+        self.diagnostics.add_counter("commands out", lambda: self.ack.sent)
+        self.diagnostics.add_counter("bytes out", lambda: self.bytes_out)
+        self.diagnostics.add_counter("lines in", lambda: self.lines_in)
+        self.diagnostics.add_counter("bytes in", lambda: self.bytes_in)
+        self.diagnostics.add_counter("log_terminal [ms]", lambda: self.terminal_time * 1000)
+        self.diagnostics.add_counter("live plot draw [ms]", lambda: self.live_plot.draw_time * 1000)
+        self.diagnostics.add_counter("profiler CPU [ms]", lambda: (self.profiler_cpu_time + (self.profiler.cpu_time if self.profiler else 0.0)) * 1000)
+        self.diagnostics.add_gauge("serial input buffer [bytes]", lambda: self.serial_port.in_waiting if self.serial_port else 0)
+        self.diagnostics.add_gauge("unacknowledged commands", lambda: self.ack.outstanding)
+        self.diagnostics.add_gauge("telemetry queue", self.telemetry.pending)
+        self.diagnostics.watch_tk(self.root)
+        self.diagnostics.start()
         
 
     def create_widgets(self):
@@ -56,6 +124,10 @@ class VarComInterface:
         
         self.status_label = ttk.Label(conn_frame, text="Disconnected", foreground="red")
         self.status_label.grid(row=0, column=4, padx=5)
+
+        # Not shown until link_optimizer.BAUD_COMMAND is verified on the drive
+        # ttk.Button(conn_frame, text="Fast link", command=self.optimise_link).grid(row=0, column=5, padx=5)
+        ttk.Button(conn_frame, text="Diagnostics", command=self.open_diagnostics).grid(row=0, column=6, padx=5)
         
         # Terminal Frame
         terminal_frame = ttk.LabelFrame(self.root, text="Terminal", padding=10)
@@ -91,20 +163,30 @@ class VarComInterface:
         ttk.Button(self.cmd_shortcut_frame, text="CCW", command=lambda: self.perception()).grid(row=1, column=1, padx=5)
         ttk.Button(self.cmd_shortcut_frame, text="CW", command=lambda: self.perception(-1)).grid(row=2, column=1, padx=5)
         ttk.Button(self.cmd_shortcut_frame, text="Keshner", command=self.keshner_motion).grid(row=1, column=2, padx=5)
-        ttk.Button(self.cmd_shortcut_frame, text="STOP", command=self.stop_motor, style="Big.TButton").grid(row=1, column=3, padx=5, rowspan=2)
+        ttk.Button(self.cmd_shortcut_frame, text="STOP", command=self.emergency_stop, style="Big.TButton").grid(row=1, column=3, padx=5, rowspan=2)
         ttk.Button(self.cmd_shortcut_frame, text="Get record", command=self.get_recorded_data).grid(row=1, column=4, padx=40)
         
         self.experiment_panel = ttk.Frame(terminal_frame)
         self.experiment_panel.pack()
+        self.Participant = tk.StringVar()
+        self.Condition = tk.StringVar()
+        ttk.Label(self.experiment_panel, text="Participant").pack()
+        ttk.Entry(self.experiment_panel, textvariable=self.Participant, width=20).pack()
+        ttk.Label(self.experiment_panel, text="Condition").pack()
+        ttk.Entry(self.experiment_panel, textvariable=self.Condition, width=20).pack()
         self.First_f = tk.IntVar(value=1)
         self.Second_f = tk.IntVar(value=1)
         self.Third_f = tk.IntVar(value=1)
+        self.Optimised_phase = tk.IntVar(value=0)
+        self.Rolling_record = tk.IntVar(value=0)
         tick_box1 = ttk.Checkbutton(self.experiment_panel, text="1st F?", variable=self.First_f)
         tick_box2 = ttk.Checkbutton(self.experiment_panel, text="2nd F?", variable=self.Second_f)
         tick_box3 = ttk.Checkbutton(self.experiment_panel, text="3rd F?", variable=self.Third_f)
         tick_box1.pack()
         tick_box2.pack()
         tick_box3.pack()
+        ttk.Checkbutton(self.experiment_panel, text="Optimised phases?", variable=self.Optimised_phase).pack()
+        ttk.Checkbutton(self.experiment_panel, text="Rolling record?", variable=self.Rolling_record).pack()
         ttk.Button(self.experiment_panel, text="Call Partial Motion", command=self.partial_motion).pack()
         
         # Status Dashboard
@@ -114,6 +196,13 @@ class VarComInterface:
         self.speed_label.set(str(self.speed))
         tk.Label(self.status_dashboard, textvariable=self.speed_label).pack(side="left", padx=5)
 
+        # Live Plot Frame
+        plot_frame = ttk.LabelFrame(self.root, text="Live Plot", padding=10)
+        plot_frame.pack(fill="both", expand=True, padx=10, pady=5)
+
+        self.live_plot = LivePlot(plot_frame)
+        self.live_plot.pack(fill="both", expand=True)
+
         # Script Frame
         script_frame = ttk.LabelFrame(self.root, text="Script", padding=10)
         script_frame.pack(fill="both", expand=True, padx=10, pady=5)
@@ -125,7 +214,7 @@ class VarComInterface:
 
         
     def refresh_ports(self):
-        ports = [port.device for port in serial.tools.list_ports.comports()]
+        ports = [port.device for port in serial.tools.list_ports.comports()] + [SimulatedDrive.PORT]
         self.port_combo['values'] = ports
         if ports:
             self.port_combo.current(0)
@@ -143,27 +232,46 @@ class VarComInterface:
             return
         
         try:
-            self.serial_port = serial.Serial(
-                port=port,
-                baudrate=115200,
-                bytesize=8,
-                parity='N',
-                stopbits=1,
-                timeout=1
-            )
+            self.serial_port = self._open_port(port)
+            self.awaiting.clear()
+            self.port_name = port
+            self.port_identity = port_identity(port)
             self.connected = True
             self.connect_btn.config(text="Disconnect")
             self.status_label.config(text="Connected", foreground="green")
             self.log_terminal("Connected to " + port)
+            self.telemetry.log(telemetry.NOTE, "Connected to " + port)
             
             # Start reading thread
             threading.Thread(target=self.read_serial, daemon=True).start()
+
+            # Start watching the connection
+            self.watchdog = ConnectionWatchdog(
+                probe=self._probe_link,
+                reconnect=self._reconnect,
+                is_paused=lambda: self.getting_record or self.link_busy or TEST_MODE,
+                on_event=self._log_connection_event,
+                on_failed=lambda: self.root.after(0, self.disconnect))
+            self.watchdog.start()
             
         except Exception as e:
             messagebox.showerror("Connection Error", str(e))
     
     def disconnect(self):
+        if self.watchdog:
+            self.watchdog.stop()
+            self.watchdog = None
+
         if self.serial_port:
+            if self.baudrate != BAUDRATE:
+                # Leave the drive at the default rate, so it is found again on the next connect
+                self.link_busy = True
+                threading.Event().wait(0.1)  # Let the reader stop
+                try:
+                    self.baudrate = link_optimizer.negotiate_baud(self.serial_port, (BAUDRATE,))
+                except Exception as e:
+                    self.log_terminal(f"Drive left at {self.baudrate} baud: {e}")
+                self.link_busy = False
             self.serial_port.close()
             self.serial_port = None
         
@@ -171,21 +279,25 @@ class VarComInterface:
         self.connect_btn.config(text="Connect")
         self.status_label.config(text="Disconnected", foreground="red")
         self.log_terminal("Disconnected")
+        self.telemetry.log(telemetry.NOTE, "Disconnected")
         # To check how many threads are still alive
         print(threading.enumerate())
     
     def read_serial(self):
         if TEST_MODE: return
 
-        while self.connected and self.serial_port and not self.getting_record:
+        port = self.serial_port
+        while self.connected and port and self.serial_port is port and not self.getting_record and not self.link_busy:
             try:
-                if self.serial_port.in_waiting:
-                    data = self.serial_port.readline().decode('ascii', errors='ignore').strip()
+                if port.in_waiting:
+                    data = self._read_line().strip()
                     # if data:
                     #     self.log_terminal("← " + data)
                     self.post_process_read_data(data)
             except Exception as e:
-                self.log_terminal(f"Read error: {e}")
+                if self.serial_port is port:
+                    self.log_terminal(f"Read error: {e}")
+                    if self.watchdog: self.watchdog.notify_failure()
                 break
     
     def send_command(self):
@@ -198,9 +310,10 @@ class VarComInterface:
             return
         
         try:
-            if not TEST_MODE:
-                self.serial_port.write((command + '\r').encode('ascii'))
-            self.log_terminal("→ " + command)
+            if self._write_serial(command):
+                self.log_terminal("→ " + command)
+            else:
+                self.log_terminal("✕ " + command + "\t\t\tRefused after a safety stop, enable the motor first")
             self.cmd_history.append(command)
             self.cmd_rollback = 0
             self.cmd_entry.delete(0, tk.END)
@@ -243,7 +356,9 @@ class VarComInterface:
                 if not self.connected:
                     break
                 try:
-                    self.serial_port.write((line + '\r').encode('ascii'))
+                    if not self._write_serial(line):
+                        self.log_terminal("✕ " + line + "\t\t\tRefused after a safety stop, script stopped")
+                        break
                     self.log_terminal("→ " + line)
                     threading.Event().wait(0.5)  # Small delay between commands
 
@@ -253,11 +368,25 @@ class VarComInterface:
         
         threading.Thread(target=run_script, daemon=True).start()
     
+    def on_close(self) -> None:
+        if self.connected:
+            self.disconnect()
+        if self.profiler:
+            self.toggle_profile()
+        self.diagnostics.stop()
+        self.supervisor.close()
+        self.trials.close()
+        self.telemetry.close()
+        self.root.destroy()
+        return
+
     def log_terminal(self, message):
+        t_start = time.perf_counter()
         self.terminal.config(state="normal")
         self.terminal.insert(tk.END, message + "\n")
         self.terminal.see(tk.END)
         self.terminal.config(state="disabled")
+        self.terminal_time += time.perf_counter() - t_start
 
 
     def home_position(self) -> None:
@@ -285,82 +414,33 @@ class VarComInterface:
 
         return
     
-    def partial_motion(self) -> None:
-
-        
-        self.log_terminal("Setting up Keshner motion...")
-        
-        #Create Keshner motion table
-        Keshner = KeshnerMotion(delta_t)
-        threading.Event().wait(0.5)  # Small delay between commands
-        
-        def partial_motion_track() -> None:
-            
-            # switch the opmode to velocity control
-            self._opmode_switch(0)
-
-            self._send_command("knli 12")
-            threading.Event().wait(0.5)  # Small delay between commands
-
-            # change top acceleration
-            self.change_acc(360*6)
-
-            # switch off the echo
-            self._send_command(API_rotation_chair.quiet())
-            self.quiet = True
-            
-            self.log_terminal("Count in...")
-            for _ in range(3):
-                self.log_terminal(str(3 - _) + "!")
-                threading.Event().wait(1)
-
-            # Start the recording
-            # self._setup_record(0.1, Keshner.TIME_TOTAL, ["PCMD", "V"])
-            next_time = time.time() + delta_t
-
-            # Send the jogging command
-            for vo, po in zip(Keshner.speed_table, Keshner.position_table):
-                if not self.motor_active: break
-                # t_start = time.time()
-                self._send_command(API_rotation_chair.jogging(vo))
-                # dt = time.time() - t_start
-                # self._command_delay(round(delta_t - dt,3))
-
-                while time.time() < next_time:  pass
-                next_time = next_time + delta_t
-
-            self.change_acc(90)
+    def partial_motion(self, delta_t:float = 0.02) -> None:
+        """
+        Implement a Keshner motion with only the ticked frequency bands to the servo.
 
-            # Stop jogging
-            self._send_command(API_rotation_chair.jogging(0))
-            threading.Event().wait(6)  # Small delay between commands
+        :param delta_t: the expected time difference between each time step
+        :type delta_t: float
+        """
 
-            # switch on the echo
-            self._send_command(API_rotation_chair.dequiet())
-            self.quiet = False
+        if not self.connected and not TEST_MODE:
+            messagebox.showwarning("Warning", "Not connected to motor controller")
+            return
 
-            # switch the opmode back to position control.
-            self._opmode_switch(8)
-            
-            self._send_command("knli 8")
-            threading.Event().wait(0.5)  # Small delay between commands
+        bands = (bool(self.First_f.get()), bool(self.Second_f.get()), bool(self.Third_f.get()))
+        if not any(bands):
+            messagebox.showwarning("Warning", "Please tick at least one frequency band")
+            return
 
-            # go back home
-            self._send_command(API_rotation_chair.moveabs(0, 20))
+        self.log_terminal("Setting up partial Keshner motion...")
 
-            # End
-            self.log_terminal("End of the motion.")
-            
-            # Get the recorded data
-            # self.get_recorded_data(Keshner)
+        #Create Keshner motion table
+        Keshner = KeshnerMotion(delta_t, bands=bands, phases=self._keshner_phases())
+        if not self._preflight(Keshner): return
+        threading.Event().wait(0.5)  # Small delay between commands
 
-            
-            # switch on the echo
-            self._send_command(API_rotation_chair.dequiet())
-            
-        
         # Start a thread for tracking the motion
-        threading.Thread(target=partial_motion_track, daemon=True).start()
+        self.motion_thread = threading.Thread(target=self._track_motion, args=(Keshner,), daemon=True)
+        self.motion_thread.start()
 
 
     def keshner_motion(self, delta_t:float = 0.02) -> None:
@@ -378,79 +458,194 @@ class VarComInterface:
         self.log_terminal("Setting up Keshner motion...")
         
         #Create Keshner motion table
-        Keshner = KeshnerMotion(delta_t)
+        Keshner = KeshnerMotion(delta_t, phases=self._keshner_phases())
+        if not self._preflight(Keshner): return
         threading.Event().wait(0.5)  # Small delay between commands
-        
-        def motion_track() -> None:
-            
-            # switch the opmode to velocity control
-            self._opmode_switch(0)
 
-            self._send_command("knli 12")
-            threading.Event().wait(0.5)  # Small delay between commands
+        # Start a thread for tracking the motion
+        self.motion_thread = threading.Thread(target=self._track_motion, args=(Keshner,), daemon=True)
+        self.motion_thread.start()
 
-            # change top acceleration
-            self.change_acc(360*6)
 
-            # switch off the echo
-            self._send_command(API_rotation_chair.quiet())
-            self.quiet = True
-            
-            self.log_terminal("Count in...")
-            for _ in range(3):
-                self.log_terminal(str(3 - _) + "!")
-                threading.Event().wait(1)
+    def _keshner_phases(self) -> list[float]|None:
+        """
+        The phases exported by phase_optimizer if "Optimised phases?" is ticked, otherwise None (all zeros).
+        """
+        if not self.Optimised_phase.get():
+            return None
+        try:
+            phases = phase_optimizer.load_phases()
+            self.log_terminal(f"Using optimised phases from {phase_optimizer.DEFAULT_PHASE_FILE}")
+            return phases
+        except (OSError, ValueError) as e:
+            self.log_terminal(f"Optimised phases unavailable, zero phases used: {e}")
+            return None
+
+    def _preflight(self, motion:SumOfSinesMotion) -> bool:
+        """
+        Check the motion against the drive limits before it is run.\r
+        The predicted errors are logged; violations must be confirmed by the user.
 
-            # Start the recording
-            # self._setup_record(0.1, Keshner.TIME_TOTAL, ["PCMD", "V"])
-            next_time = time.time() + delta_t
+        :return: Whether the motion should be run
+        :rtype: bool
+        """
+        report = check_feasibility(motion, MOTION_ACC)
+        self.preflight_report = report
+        for line in report.summary():
+            self.log_terminal("Preflight: " + line)
 
-            # Send the jogging command
-            for vo, po in zip(Keshner.speed_table, Keshner.position_table):
-                if not self.motor_active: break
-                # t_start = time.time()
-                self._send_command(API_rotation_chair.jogging(vo))
-                # dt = time.time() - t_start
-                # self._command_delay(round(delta_t - dt,3))
+        if report.feasible:
+            return True
+        return messagebox.askokcancel("Preflight", "The motion exceeds the drive limits:\n" + "\n".join(report.summary()) + "\n\nRun anyway?")
 
-                while time.time() < next_time:  pass
-                next_time = next_time + delta_t
+    def _track_motion(self, motion:SumOfSinesMotion) -> None:
+        """
+        Jog the chair through the speed table of a motion, one command every sampling time.
+        Meant to be run in its own thread.
 
-            self.change_acc(90)
+        :param motion: The motion to be tracked
+        :type motion: SumOfSinesMotion
+        """
+        delta_t = motion.sampling_time
+        jog_commands = link_optimizer.compact_stream(API_rotation_chair.jogging_table(motion.exact_positions(), delta_t))
 
-            # Stop jogging
-            self._send_command(API_rotation_chair.jogging(0))
-            threading.Event().wait(6)  # Small delay between commands
+        # A stop at any point (STOP button, disable, safety trip) aborts the run: no re-enable, no homing.
+        # The stop count is used as well, since enabling the motor during the setup resets the supervisor.
+        stops_before = self.supervisor.stops
+        aborted = lambda: self.supervisor.tripped or self.supervisor.stops != stops_before or not self.motor_active
 
-            # switch on the echo
-            self._send_command(API_rotation_chair.dequiet())
-            self.quiet = False
+        # switch the opmode to velocity control
+        self._opmode_switch(0)
 
-            # switch the opmode back to position control.
-            self._opmode_switch(8)
-            
-            self._send_command("knli 8")
-            threading.Event().wait(0.5)  # Small delay between commands
+        self._send_command("knli 12")
+        threading.Event().wait(0.5)  # Small delay between commands
 
-            # go back home
-            self._send_command(API_rotation_chair.moveabs(0, 20))
+        # change top acceleration
+        self.change_acc(MOTION_ACC)
 
-            # End
-            self.log_terminal("End of the motion.")
-            
-            # Get the recorded data
-            # self.get_recorded_data(Keshner)
+        # switch off the echo
+        self._send_command(API_rotation_chair.quiet())
+        self._set_state("quiet", True)
+        
+        self.log_terminal("Count in...")
+        self.telemetry.log(telemetry.TIMING, "count in")
+        for _ in range(3):
+            if aborted(): break
+            self.log_terminal(str(3 - _) + "!")
+            threading.Event().wait(1)
+        if aborted():
+            self.log_terminal("Motion aborted before the start, the motor stays disabled.")
+            self.stop_motor()
+            self._send_command(API_rotation_chair.dequiet())
+            self._set_state("quiet", False)
+            return
 
-            
-            # switch on the echo
+        # Start the recording
+        recorder = None
+        if self.Rolling_record.get():
+            self.log_terminal("Rolling record: the readback safety checks are off, only the commanded speeds are checked.")
+            self.telemetry.log(telemetry.NOTE, "readback safety checks off during the rolling record")
+            recorder = self._start_rolling_record(ROLLING_RECORD_TIME, motion.TIME_TOTAL)
+        next_time = time.time() + delta_t
+        self.live_plot.clear()
+        self.t_motion_start = time.time()
+        t_motion_start_mono = time.monotonic()
+        started = datetime.datetime.now()
+        self.telemetry.log(telemetry.TIMING, f"motion start: {len(jog_commands)} ticks of {delta_t} s")
+        ticks = 0
+        max_late = 0.0
+        sent_before, acknowledged_before = self.ack.sent, self.ack.acknowledged
+
+        # Send the jogging command
+        self.angle_zero = None
+        self.getting_speed = True
+        self.supervisor.arm()
+        # The plotted command is the velocity written to the drive, and its integral;
+        # the measured traces come from the readbacks the supervisor polls (see post_process_read_data)
+        cmd_speed = 0.0         #[deg/s]
+        cmd_angle = 0.0         #[deg]
+        for jog in jog_commands:
+            if jog is not None:     # a repeated velocity is not sent again
+                cmd_speed = float(API_rotation_chair.rpm2degs(float(jog.split()[1])))
+            if aborted() or not self.supervisor.check_command(cmd_speed): break
+            # t_start = time.time()
+            if jog is not None:
+                self._send_command(jog)
+                ticks += 1
+                max_late = max(max_late, time.time() - next_time + delta_t)
+            t_now = time.time() - self.t_motion_start
+            self.live_plot.push("cmd_speed", t_now, cmd_speed)
+            self.live_plot.push("cmd_angle", t_now, cmd_angle)
+            cmd_angle += cmd_speed * delta_t
+            # dt = time.time() - t_start
+            # self._command_delay(round(delta_t - dt,3))
+
+            while time.time() < next_time:  pass
+            next_time = next_time + delta_t
+
+        self.supervisor.arm(False)
+        self.telemetry.log(telemetry.TIMING, f"motion end: {ticks} ticks sent, max send delay {max_late*1000:.2f} ms")
+        threading.Event().wait(0.1)  # Let the last prompts come in
+        self.log_terminal(f"{self.ack.acknowledged - acknowledged_before} of {self.ack.sent - sent_before} commands acknowledged")
+        self.getting_speed = False
+        ended = datetime.datetime.now()
+        metrics = {
+            "ticks_sent": ticks,
+            "max_send_delay": max_late,
+            "commands_acknowledged": self.ack.acknowledged - acknowledged_before,
+            "commands_sent": self.ack.sent - sent_before,
+            "safety_stop": self.supervisor.tripped,
+            "aborted": aborted(),
+        }
+        if recorder:
+            recorder.stop()
+            while self.getting_record:  threading.Event().wait(0.1)     # let the last window download
+            t_offset = recorder.t_zero - t_motion_start_mono if recorder.t_zero is not None else 0.0
+            try:
+                metrics.update(record_metrics(*load_record(recorder.file_name), motion, t_offset))
+            except Exception as e:
+                self.log_terminal(f"Record summary error: {e}")
+        self._store_trial(motion, started, ended, metrics, recorder.file_name if recorder else None)
+
+        if aborted():
+            self.log_terminal("Motion aborted, the motor stays disabled.")
+            self.stop_motor()
             self._send_command(API_rotation_chair.dequiet())
-            
+            self._set_state("quiet", False)
+            return
+
+        self.change_acc(90)
+
+        # Stop jogging
+        self._send_command(API_rotation_chair.jogging(0))
+        threading.Event().wait(6)  # Small delay between commands
+
+        # switch on the echo
+        self._send_command(API_rotation_chair.dequiet())
+        self._set_state("quiet", False)
+
+        # switch the opmode back to position control.
+        self._opmode_switch(8)
         
-        # Start a thread for tracking the motion
-        threading.Thread(target=motion_track, daemon=True).start()
+        self._send_command("knli 8")
+        threading.Event().wait(0.5)  # Small delay between commands
+
+        # go back home
+        self._send_command(API_rotation_chair.moveabs(0, 20))
+
+        # End
+        self.log_terminal("End of the motion.")
+        
+        # Get the recorded data
+        # self.get_recorded_data(motion)
+
+        
+        # switch on the echo
+        self._send_command(API_rotation_chair.dequiet())
+
+        return
 
 
-    
     def perception(self, direction: int = 1):
         if not self.connected:
             messagebox.showwarning("Warning", "Not connected to motor controller")
@@ -489,13 +684,23 @@ class VarComInterface:
         if not line: return
         
         if self.getting_speed:
-            space_pos = line.find(" ")
-            if space_pos != -1:
+            if line.startswith(link_optimizer.PROMPT): return      # acknowledgements of the jogs and readback requests
+            parts = line.split()
+            if len(parts) == 2 and parts[1] in ("[rpm]", "[counts]"):
                 try:
-                    vel = float(line[:space_pos])
-                    self._change_speed(vel)
-                except:
-                    print("Unreadable")
+                    value = float(parts[0])
+                except ValueError:
+                    self.log_terminal("← " + line)
+                    return
+                t_now = time.time() - self.t_motion_start
+                if parts[1] == "[rpm]":
+                    self._change_speed(value)
+                    self.supervisor.on_readback(value * 6)
+                    self.live_plot.push("meas_speed", t_now, value * 6)   # [rpm] to [deg/s]
+                else:
+                    if self.angle_zero is None:
+                        self.angle_zero = value
+                    self.live_plot.push("meas_angle", t_now, float(API_rotation_chair.counts2deg(value - self.angle_zero)))
                 return
 
         self.log_terminal("← " + line)
@@ -510,6 +715,7 @@ class VarComInterface:
         """
     
         # change the acceleration cap
+        self.acc_value = val
         self._send_command(API_rotation_chair.acc(val))
         threading.Event().wait(0.5)  # Small delay between commands
         self._send_command(API_rotation_chair.dec(val))
@@ -522,9 +728,9 @@ class VarComInterface:
         """
         Enable function to enable the motor.
         """
-        self.motor_active = True
+        self._set_state("motor_active", True)
 
-        self._send_command(API_rotation_chair.enable_motor(), "Motor Enable")
+        self._send_command(API_rotation_chair.enable_motor(), "Motor Enable")   # resets the safety supervisor
         threading.Event().wait(0.5)  # Small delay between commands
         return
 
@@ -532,12 +738,20 @@ class VarComInterface:
         """
         Stop function to stop the chair immediately and disable the motor.
         """
-        self.motor_active = False
-
+        self._set_state("motor_active", False)
 
         self._send_command(API_rotation_chair.disable_motor(), "Motor Stop")
         threading.Event().wait(0.5)  # Small delay between commands
         return
+
+    def emergency_stop(self) -> None:
+        """
+        STOP button: hand the stop to the safety supervisor, which writes it ahead of any other command.
+        Returns immediately.
+        """
+        self._set_state("motor_active", False)
+        self.supervisor.emergency_stop("STOP button")
+        return
     
     def get_recorded_data(self, motion_parameter:KeshnerMotion|None = None) -> None:
         self.getting_record = True
@@ -567,8 +781,9 @@ class VarComInterface:
         if not command: return
         
         try:
-            if not TEST_MODE:
-                self.serial_port.write((command + '\r').encode('ascii'))
+            if not self._write_serial(command):
+                self.log_terminal("✕ " + command + "\t\t\tRefused after a safety stop")
+                return
             if self.quiet or self.getting_speed: return
             self.log_terminal("→ " + command + "\t\t\t" + log_message)
         except Exception as e:
@@ -608,6 +823,339 @@ class VarComInterface:
 
         return
     
+    def _write_serial(self, command:str) -> bool:
+        '''
+        Write a command to the motor controller and log it in the session telemetry.\r
+        After a safety stop, motion commands are refused until the motor is enabled again;
+        an enable command, by any path, resets the safety supervisor.
+
+        :return: Whether the command was written, False when refused by the safety supervisor
+        :rtype: bool
+        '''
+        if command.strip().lower() == API_rotation_chair.enable_motor():
+            self.supervisor.reset()
+        with self.write_lock:
+            # Checked under the write lock, so no motion command can follow the stop command
+            if not self.supervisor.allows(command):
+                self.telemetry.log(telemetry.NOTE, f"refused after a safety stop: {command}")
+                return False
+            if not TEST_MODE:
+                try:
+                    data = (command + '\r').encode('ascii')
+                    self.serial_port.write(data)
+                    self.bytes_out += len(data)
+                    self.ack.on_send()
+                    self.awaiting.append(False)
+                except (serial.SerialException, OSError):
+                    if self.watchdog: self.watchdog.notify_failure()
+                    raise
+            self.telemetry.log(telemetry.TX, command)
+        return True
+
+    def _probe_link(self) -> None:
+        '''
+        The probe of the connection watchdog: an empty command, which the drive answers with its prompt.
+        Neither the probe nor its answer is logged, so an idle link does not fill the terminal and the telemetry.
+        '''
+        with self.write_lock:
+            try:
+                self.serial_port.write(b'\r')
+                self.bytes_out += 1
+                self.ack.on_send()
+                self.awaiting.append(True)
+            except (serial.SerialException, OSError):
+                if self.watchdog: self.watchdog.notify_failure()
+                raise
+        return
+
+    def _write_stop(self, command:str) -> None:
+        '''
+        The write path of the safety supervisor: written as is, the caller holds the write lock.
+        '''
+        if not TEST_MODE and self.serial_port:
+            data = (command + '\r').encode('ascii')
+            self.serial_port.write(data)
+            self.bytes_out += len(data)
+            self.ack.on_send()
+            self.awaiting.append(False)
+        self.telemetry.log(telemetry.TX, command)
+        return
+
+    def _read_line(self) -> str:
+        '''
+        Read a line from the motor controller and log it in the session telemetry.\r
+        The drive answers the commands in the order they were written, each with one prompt, so every prompt
+        is matched to the oldest command not answered yet; the echo and the prompt of a watchdog probe are dropped.
+        '''
+        data = self.serial_port.readline()
+        line = data.decode('ascii', errors='ignore')
+        if line:
+            self.bytes_in += len(data)
+            self.lines_in += 1
+            if self.watchdog: self.watchdog.notify_rx()
+            self.ack.on_line(line.strip())
+            probe = bool(self.awaiting) and self.awaiting[0]
+            if line.strip().startswith(link_optimizer.PROMPT):
+                if self.awaiting:
+                    self.awaiting.popleft()
+                if probe:
+                    return ""
+            elif probe and not line.strip():
+                # The empty echo of a watchdog probe: not logged
+                return ""
+            self.telemetry.log(telemetry.RX, line.rstrip("\r\n"))
+        return line
+
+    def _open_port(self, port:str):
+        '''
+        Open a serial port, or the simulated drive.
+        '''
+        if port == SimulatedDrive.PORT:
+            return SimulatedDrive(timeout=SERIAL_TIMEOUT)
+        return serial.Serial(
+            port=port,
+            baudrate=self.baudrate,
+            bytesize=8,
+            parity='N',
+            stopbits=1,
+            timeout=SERIAL_TIMEOUT
+        )
+
+    def _reconnect(self) -> bool:
+        '''
+        Reopen the same device, found by its serial number or VID:PID, and restore the drive state:
+        echo, acc/dec and, if the motor is disabled, the opmode.
+        An active motor keeps running on the drive during a link outage, so it is not disturbed.\r
+        The link is reopened at the negotiated baud rate; a drive that does not answer there, e.g. after a
+        power-cycle, is tried at the default BAUDRATE, and the link stays there.
+        Called by the watchdog.
+
+        :return: Whether the device is connected again
+        :rtype: bool
+        '''
+        port = self.port_name if self.port_name == SimulatedDrive.PORT else find_port(*self.port_identity, fallback=self.port_name)
+        if port is None:
+            return False
+
+        old_port = self.serial_port
+        try:
+            if old_port: old_port.close()
+        except Exception:
+            pass
+        negotiated = self.baudrate
+        new_port = None
+        for rate in dict.fromkeys((negotiated, BAUDRATE)):
+            self.baudrate = rate
+            new_port = self._open_port(port)
+            if link_optimizer.probe(new_port):
+                break
+            new_port.close()
+            new_port = None
+        if new_port is None:
+            self.baudrate = negotiated
+            return False
+        if self.baudrate != negotiated:
+            self.log_terminal(f"Drive answers at {self.baudrate} baud, not {negotiated}: back to the default rate")
+            self._set_state("baudrate", self.baudrate)
+        self.serial_port = new_port
+        self.awaiting.clear()
+        self.port_name = port
+
+        self._write_serial(API_rotation_chair.quiet() if self.quiet else API_rotation_chair.dequiet())
+        if self.acc_value:
+            self._write_serial(API_rotation_chair.acc(self.acc_value))
+            self._write_serial(API_rotation_chair.dec(self.acc_value))
+        if not self.motor_active and self.opmode is not None:
+            self._write_serial(API_rotation_chair.opmode(self.opmode))
+
+        if not self.getting_record:
+            threading.Thread(target=self.read_serial, daemon=True).start()
+        return True
+
+    def optimise_link(self) -> None:
+        '''
+        Measure the command bandwidth, switch to the highest baud rate the drive answers at,
+        and measure again. The reader is paused meanwhile.
+        '''
+        if not self.connected or TEST_MODE:
+            messagebox.showwarning("Warning", "Not connected to motor controller")
+            return
+        if self.motor_active or self.getting_record or (self.motion_thread and self.motion_thread.is_alive()):
+            messagebox.showwarning("Warning", "The link cannot be optimised during a motion or a record")
+            return
+
+        def run() -> None:
+            self.link_busy = True
+            threading.Event().wait(0.1)  # Let the reader stop
+            try:
+                before = link_optimizer.measure_bandwidth(self.serial_port)
+                self.baudrate = link_optimizer.negotiate_baud(self.serial_port)
+                after = link_optimizer.measure_bandwidth(self.serial_port)
+                self.log_terminal(f"Link: {before['commands/s']:.0f} -> {after['commands/s']:.0f} commands/s, "
+                                  f"{before['round trip [ms]']:.2f} -> {after['round trip [ms]']:.2f} ms round trip at {self.baudrate} baud")
+                self._set_state("baudrate", self.baudrate)
+            except Exception as e:
+                self.log_terminal(f"Link error: {e}")
+            self.awaiting.clear()       # answered to the optimiser, not to the reader
+            self.link_busy = False
+            threading.Thread(target=self.read_serial, daemon=True).start()
+
+        threading.Thread(target=run, daemon=True).start()
+        return
+
+    def open_diagnostics(self) -> None:
+        '''
+        Show the diagnostics panel: link rates, queue depths, UI frame latency and CPU per thread,
+        refreshed every second, and the sampling profiler with its interval and its own CPU use.
+        '''
+        if self.diagnostics_window and self.diagnostics_window.winfo_exists():
+            self.diagnostics_window.lift()
+            return
+
+        window = tk.Toplevel(self.root)
+        window.title("Diagnostics")
+        window.geometry("460x420")
+        self.diagnostics_window = window
+
+        tree = ttk.Treeview(window, columns=("value",), height=18)
+        tree.heading("#0", text="Metric")
+        tree.heading("value", text="Value")
+        tree.column("value", width=120, anchor="e")
+        tree.pack(fill="both", expand=True, padx=10, pady=5)
+        sections = {name: tree.insert("", "end", text=name, open=True) for name in ("Link and UI", "CPU per thread [%]")}
+
+        profile_frame = ttk.Frame(window)
+        profile_frame.pack(pady=5)
+        ttk.Label(profile_frame, text="Interval [ms]").pack(side="left", padx=5)
+        ttk.Spinbox(profile_frame, from_=round(SamplingProfiler.MIN_INTERVAL * 1000), to=200, increment=5,
+                    textvariable=self.profile_interval, width=5).pack(side="left", padx=5)
+        self.profile_btn = ttk.Button(profile_frame, text="Stop profile" if self.profiler else "Start profile", command=self.toggle_profile)
+        self.profile_btn.pack(side="left", padx=5)
+
+        def refresh() -> None:
+            if not window.winfo_exists():
+                return
+            values, thread_cpu = self.diagnostics.snapshot()
+            for section, rows in [("Link and UI", values), ("CPU per thread [%]", dict(sorted(thread_cpu.items(), key=lambda item: -item[1])))]:
+                tree.delete(*tree.get_children(sections[section]))
+                for name, value in rows.items():
+                    tree.insert(sections[section], "end", text=name, values=(f"{value:.1f}",))
+            window.after(int(self.diagnostics.interval * 1000), refresh)
+        refresh()
+        return
+
+    def toggle_profile(self) -> None:
+        '''
+        Start the sampling profiler at the interval of the diagnostics panel,
+        or stop it and write the collapsed stacks next to the session log.
+        '''
+        if self.profiler is None:
+            try:
+                interval = max(self.profile_interval.get() / 1000, SamplingProfiler.MIN_INTERVAL)
+            except tk.TclError:
+                interval = SamplingProfiler.INTERVAL
+            self.profiler = SamplingProfiler(interval)
+            self.profiler.start()
+            self.log_terminal(f"Profiling every {interval*1000:.0f} ms...")
+        else:
+            profiler = self.profiler
+            file_name = profiler.stop()
+            self.profiler = None
+            self.profiler_cpu_time += profiler.cpu_time
+            self.log_terminal(f"Profile of {profiler.samples} samples written to {file_name}, "
+                              f"{profiler.cpu_time*1000:.0f} ms CPU used by the profiler")
+        if self.diagnostics_window and self.diagnostics_window.winfo_exists():
+            self.profile_btn.config(text="Stop profile" if self.profiler else "Start profile")
+        return
+
+    def _poll_readbacks(self) -> None:
+        '''
+        Request the velocity and position readbacks, called by the safety supervisor while a motion runs.
+        The answers are handled in post_process_read_data.\r
+        Not while a record is read: the reader is paused then, so the readback checks of the supervisor
+        (measured speed, angle, runaway) are off for a motion with a rolling record. The commanded speeds are still checked.
+        '''
+        if self.connected and not self.getting_record:
+            self._write_stop(API_rotation_chair.velocity())
+            self._write_stop(API_rotation_chair.position())
+        return
+
+    def _on_safety_stop(self, reason:str) -> None:
+        '''
+        Called by the safety supervisor once the stop command is written.
+        '''
+        self._set_state("motor_active", False)
+        latency = self.supervisor.stop_latency[-1] * 1000 if self.supervisor.stop_latency else float("nan")
+        self.log_terminal(f"Motor Stop: {reason} ({latency:.2f} ms)")
+        self.telemetry.log(telemetry.NOTE, f"safety stop: {reason}, {latency:.3f} ms")
+        return
+
+    def _store_trial(self, motion:SumOfSinesMotion, started:datetime.datetime, ended:datetime.datetime, metrics:dict[str, float], record_file:str|None) -> None:
+        '''
+        Add a run to the trial database, with the participant and condition of the experiment panel
+        and the summary of the preflight check.
+        '''
+        report = self.preflight_report
+        if report is not None and report.sampling_time == motion.sampling_time:
+            metrics = {
+                "preflight_peak_speed": report.peak_speed,
+                "preflight_peak_acc": report.peak_acc,
+                "preflight_max_tracking_error": report.max_tracking_error,
+                **metrics,
+            }
+        files = {"telemetry": self.telemetry.file_name}
+        if record_file:
+            files["record"] = record_file
+        try:
+            trial_id = self.trials.add_trial(motion, started, ended, self.Participant.get().strip(), self.Condition.get().strip(), files, metrics)
+            self.log_terminal(f"Trial {trial_id} stored in {self.trials.file_name}")
+        except Exception as e:
+            self.log_terminal(f"Trial database error: {e}")
+        return
+
+    def _log_connection_event(self, message:str) -> None:
+        self.log_terminal(message)
+        self.telemetry.log(telemetry.NOTE, message)
+        return
+
+    def _set_state(self, name:str, value) -> None:
+        '''
+        Change a state flag of the interface and log it in the session telemetry.
+        '''
+        setattr(self, name, value)
+        self.telemetry.log(telemetry.STATE, f"{name}={value}")
+        return
+
+    def _start_rolling_record(self, sampling_time:float, total_time:float|None = None) -> RollingRecorder:
+        '''
+        Start a continuous acquisition in its own thread, see RollingRecorder.\r
+        The serial reader is paused while recording, and restarted afterwards.
+
+        :param sampling_time: The time difference between each recorded data point in seconds
+        :type sampling_time: float
+        :param total_time: The total time of the recording in seconds. None to record until stopped.
+        :type total_time: float | None
+        :return: The running recorder, stop it with recorder.stop()
+        :rtype: RollingRecorder
+        '''
+        recorder = RollingRecorder(
+            send=self._send_command,
+            readline=lambda: self._read_line() if self.serial_port else "",
+            sample_time=sampling_time)
+
+        def run() -> None:
+            self.getting_record = True
+            try:
+                file_name = recorder.run(total_time)
+                self.log_terminal(f"Created file: {file_name} ({recorder.windows} windows, {len(recorder.gaps)} gaps)")
+            except Exception as e:
+                self.log_terminal(f"Record error: {e}")
+            self.getting_record = False
+            threading.Thread(target=self.read_serial, daemon=True).start()
+
+        threading.Thread(target=run, daemon=True).start()
+        return recorder
+
     def _opmode_switch(self, mode:int) -> None:
         '''
         Help the UI to stop the motor, change the mode, and restart the motor all at once.
@@ -621,6 +1169,7 @@ class VarComInterface:
 
         # change opmode
         self._send_command(API_rotation_chair.opmode(mode))
+        self._set_state("opmode", mode)
         threading.Event().wait(0.5)  # Small delay between commands
         self.log_terminal("Configure the new dynamic setting......")
 
@@ -649,7 +1198,7 @@ class VarComInterface:
         while self.connected and self.serial_port and self.getting_record:
             try:
                 if self.serial_port.in_waiting:
-                    data = self.serial_port.readline().decode('ascii', errors='ignore')
+                    data = self._read_line()
                     if data:
                         if data == "-->":
                             self.getting_record = False
@@ -0,0 +1,187 @@
+import json
+import os
+import time
+
+import numpy as np
+
+from keshner_motion import KeshnerMotion, SumOfSinesMotion
+
+
+DEFAULT_PHASE_FILE = "../Motion Cache/keshner_phases.json"
+
+
+class PhaseOptimizer:
+    """
+    Search the phases of a sum-of-sines spectrum that minimise its peak velocity and acceleration.\r
+    The amplitudes (and so the RMS) are fixed, hence lowering the peaks lowers the crest factors:
+    cost = max|v| / rms(v) + acc_weight * max|a| / rms(a)\r
+    Candidate phase sets are evaluated in batches as two matrix products over one fundamental period.
+    """
+
+    # CONSTANT
+    GRID_DENSITY = 8        #[-] grid points per period of the highest harmonic
+
+    def __init__(self,
+                 harmonics:list[int],
+                 amplitudes:list[float],
+                 fundamental_freq:float = SumOfSinesMotion.FUNDAMENTAL_FREQ,
+                 acc_weight:float = 1.0,
+                 batch_size:int = 512,
+                 seed:int|None = None) -> None:
+        """
+        :param harmonics: Harmonic numbers h_i of the fundamental frequency
+        :type harmonics: list[int]
+        :param amplitudes: Velocity amplitude A_i of each harmonic in [deg/s]
+        :type amplitudes: list[float]
+        :param acc_weight: Weight of the acceleration crest factor in the cost
+        :type acc_weight: float
+        :param batch_size: Number of candidate phase sets evaluated at once
+        :type batch_size: int
+        """
+        self.harmonics = np.asarray(harmonics, dtype=float)
+        self.amplitudes = np.asarray(amplitudes, dtype=float)
+        self.fundamental_freq = fundamental_freq
+        self.acc_weight = acc_weight
+        self.batch_size = batch_size
+        self.rng = np.random.default_rng(seed)
+
+        self.w = 2 * np.pi * fundamental_freq * self.harmonics
+        self.rms_speed = np.sqrt(np.sum(self.amplitudes**2) / 2)
+        self.rms_acc = np.sqrt(np.sum((self.amplitudes * self.w)**2) / 2)
+
+        # A_i*sin(w_i*t + d_i) = A_i*cos(d_i)*sin(w_i*t) + A_i*sin(d_i)*cos(w_i*t)
+        period = 1 / fundamental_freq
+        step = 1 / (self.GRID_DENSITY * fundamental_freq * self.harmonics.max())
+        t = np.arange(0.0, period, step)
+        wt = np.outer(self.w, t)
+        self._sin = np.sin(wt).astype(np.float32)
+        self._cos = np.cos(wt).astype(np.float32)
+
+    @classmethod
+    def from_motion(cls, motion:SumOfSinesMotion, **kwargs) -> "PhaseOptimizer":
+        return cls(motion.HOMONICS, motion.ANG_SPEED_HOMONICS, motion.FUNDAMENTAL_FREQ, **kwargs)
+
+    ### EXTERNAL FUNCTIONS
+    def schroeder_phases(self) -> np.ndarray:
+        '''
+        Schroeder's low-peak phases for an arbitrary power spectrum:
+        d_k = -2*pi * sum_{l<k} (k-l) * p_l, with p_l the relative power of harmonic l.
+
+        :return: The phase of each harmonic in [rad]
+        :rtype: np.ndarray
+        '''
+        power = self.amplitudes**2 / np.sum(self.amplitudes**2)
+        k = np.arange(len(power))
+        lag = np.clip(k[:, None] - k[None, :], 0, None)
+        return np.mod(-2 * np.pi * lag @ power, 2 * np.pi)
+
+    def evaluate(self, phases:np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        '''
+        Peak velocity and peak acceleration of a batch of phase sets.
+
+        :param phases: Phase sets in [rad], shape (n_sets, n_harmonics)
+        :type phases: np.ndarray
+        :return: Peak velocity in [deg/s] and peak acceleration in [deg/s^2], shape (n_sets,) each
+        :rtype: tuple[np.ndarray, np.ndarray]
+        '''
+        phases = np.atleast_2d(phases)
+        cos_d = np.cos(phases).astype(np.float32)
+        sin_d = np.sin(phases).astype(np.float32)
+
+        A = self.amplitudes.astype(np.float32)
+        speed = (cos_d * A) @ self._sin + (sin_d * A) @ self._cos
+        peak_speed = np.abs(speed).max(axis=1)
+
+        # d/dt: A_i*w_i*cos(d_i)*cos(w_i*t) - A_i*w_i*sin(d_i)*sin(w_i*t)
+        Aw = (self.amplitudes * self.w).astype(np.float32)
+        acc = (cos_d * Aw) @ self._cos - (sin_d * Aw) @ self._sin
+        peak_acc = np.abs(acc).max(axis=1)
+
+        return peak_speed.astype(float), peak_acc.astype(float)
+
+    def cost(self, phases:np.ndarray) -> np.ndarray:
+        peak_speed, peak_acc = self.evaluate(phases)
+        return peak_speed / self.rms_speed + self.acc_weight * peak_acc / self.rms_acc
+
+    def optimise(self, iterations:int = 200, initial:np.ndarray|None = None, sigma:float = 0.5) -> np.ndarray:
+        '''
+        Iterative refinement around the best phase set so far.\r
+        Every iteration evaluates one batch of random perturbations; the step size grows after an
+        improvement and shrinks otherwise.
+
+        :param iterations: Number of batches to evaluate
+        :type iterations: int
+        :param initial: Starting phase set in [rad]. None for the Schroeder phases.
+        :type initial: np.ndarray | None
+        :param sigma: Initial standard deviation of the perturbations in [rad]
+        :type sigma: float
+        :return: The best phase set in [rad]
+        :rtype: np.ndarray
+        '''
+        best = self.schroeder_phases() if initial is None else np.asarray(initial, dtype=float)
+        best_cost = self.cost(best)[0]
+
+        for _ in range(iterations):
+            candidates = best + sigma * self.rng.standard_normal((self.batch_size, len(best)))
+            costs = self.cost(candidates)
+            i = np.argmin(costs)
+            if costs[i] < best_cost:
+                best, best_cost = candidates[i], costs[i]
+                sigma = min(sigma * 1.2, np.pi)
+            else:
+                sigma = max(sigma * 0.8, 1e-3)
+
+        return np.mod(best, 2 * np.pi)
+
+    def export(self, phases:np.ndarray, file_name:str = DEFAULT_PHASE_FILE) -> None:
+        '''
+        Save a phase set with its spectrum as JSON, to be loaded by load_phases().
+        '''
+        peak_speed, peak_acc = self.evaluate(phases)
+        os.makedirs(os.path.dirname(file_name) or ".", exist_ok=True)
+        with open(file_name, 'w') as newfile:
+            json.dump({
+                "fundamental_freq": self.fundamental_freq,
+                "harmonics": self.harmonics.astype(int).tolist(),
+                "amplitudes": self.amplitudes.tolist(),
+                "phases": np.asarray(phases, dtype=float).tolist(),
+                "peak_speed": float(peak_speed[0]),
+                "peak_acc": float(peak_acc[0]),
+            }, newfile, indent=2)
+        return
+
+
+def load_phases(file_name:str = DEFAULT_PHASE_FILE, harmonics:list[int] = KeshnerMotion.HOMONICS) -> list[float]:
+    '''
+    Load the phases exported by PhaseOptimizer.export().
+
+    :param harmonics: The harmonics the phases are expected for, in the same order
+    :type harmonics: list[int]
+    :return: The phase of each harmonic in [rad]
+    :rtype: list[float]
+    '''
+    with open(file_name, 'r') as file:
+        exported = json.load(file)
+
+    if exported["harmonics"] != list(harmonics):
+        raise ValueError(f"The phases in {file_name} are for other harmonics: {exported['harmonics']}")
+    return exported["phases"]
+
+
+if __name__ == "__main__":
+    optimiser = PhaseOptimizer(KeshnerMotion.HOMONICS, KeshnerMotion.ANG_SPEED_HOMONICS, seed=0)
+    K = len(KeshnerMotion.HOMONICS)
+
+    for name, phases in [("zero", np.zeros(K)), ("schroeder", optimiser.schroeder_phases())]:
+        v, a = optimiser.evaluate(phases)
+        print(f"{name}:\tpeak v={v[0]:.1f} deg/s, peak a={a[0]:.1f} deg/s^2")
+
+    t_start = time.perf_counter()
+    best = optimiser.optimise(iterations=100)
+    dt = time.perf_counter() - t_start
+    v, a = optimiser.evaluate(best)
+    print(f"optimised:\tpeak v={v[0]:.1f} deg/s, peak a={a[0]:.1f} deg/s^2")
+    print(f"{100*optimiser.batch_size/dt:.0f} phase sets/s")
+
+    optimiser.export(best)
+    print(f"Exported to {DEFAULT_PHASE_FILE}")
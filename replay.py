@@ -0,0 +1,183 @@
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+
+import telemetry
+
+
+NUMBER = re.compile(r"[-+]?\d+(\.\d*)?([eE][-+]?\d+)?")
+
+
+@dataclass
+class ReplayResult:
+    speed: float                            # replay speed factor
+    commands: int = 0
+    duration: float = 0.0                   # [s] wall-clock time of the replay
+    original_duration: float = 0.0          # [s] time span of the commands in the session
+    mean_late: float = 0.0                  # [s] mean delay of a command behind its (scaled) original time
+    max_late: float = 0.0                   # [s]
+    mismatches: list[tuple[float, str, list[str], list[str]]] = field(default_factory=list)    # (t, command, original, replayed)
+
+    @property
+    def commands_per_second(self) -> float:
+        return self.commands / self.duration if self.duration else 0.0
+
+    def summary(self) -> list[str]:
+        return [
+            f"{self.commands} commands in {self.duration:.3f} s ({self.commands_per_second:.0f}/s), "
+            f"session span {self.original_duration:.3f} s, speed x{self.speed}",
+            f"Command delay mean {self.mean_late*1000:.3f} ms, max {self.max_late*1000:.3f} ms",
+            f"{len(self.mismatches)} responses differ from the session",
+        ]
+
+
+class ReplayEngine:
+    """
+    Re-emit the commands of a recorded session (see telemetry) to a port, and compare the responses.\r
+    Commands are sent at their original times divided by the speed factor; speed=float("inf") sends
+    them back to back to profile faster than real time. The drive ends the response to every command with
+    its prompt, so the n-th response is the lines up to the n-th prompt. In the session, the prompts are
+    counted from its start, so a replay from the middle of a session is matched to the responses of the
+    commands it replays, not to those still outstanding at t_from.
+    """
+
+    # CONSTANT
+    PROMPT = "-->"
+    SETTLE_TIME = 0.2           #[s] time to wait for the responses to the last command
+
+    def __init__(self, port, speed:float = 1.0, compare_values:bool = True) -> None:
+        """
+        :param port: An open serial.Serial or SimulatedDrive
+        :param speed: Replay speed factor
+        :type speed: float
+        :param compare_values: Compare numbers in the responses too. False to compare only their form.
+        :type compare_values: bool
+        """
+        self.port = port
+        self.speed = speed
+        self.compare_values = compare_values
+
+    ### EXTERNAL FUNCTIONS
+    def run(self, session_file:str, t_from:float = 0.0, t_to:float = float("inf")) -> ReplayResult:
+        '''
+        Replay the commands of a session between t_from and t_to [s].
+
+        :rtype: ReplayResult
+        '''
+        events = list(telemetry.read_session(session_file, {telemetry.TX, telemetry.RX}))
+        commands, original = self._session_responses(events, t_from, t_to)
+        result = ReplayResult(self.speed, commands=len(commands))
+        if not commands:
+            return result
+        result.original_duration = commands[-1][0] - commands[0][0]
+
+        received: list[str] = []
+        reading = threading.Event()
+        reading.set()
+        reader = threading.Thread(target=self._read_loop, args=(received, reading), daemon=True)
+        reader.start()
+
+        late = []
+        t_start = time.monotonic()
+        t_zero = commands[0][0]
+        for t, command in commands:
+            target = t_start + (t - t_zero) / self.speed
+            while time.monotonic() < target:  pass
+            now = time.monotonic()
+            self.port.write((command + '\r').encode('ascii'))
+            late.append(max(0.0, now - target))
+        result.duration = time.monotonic() - t_start
+
+        time.sleep(self.SETTLE_TIME)
+        reading.clear()
+        reader.join()
+
+        result.mean_late = sum(late) / len(late)
+        result.max_late = max(late)
+
+        replayed = self._split_responses(received, len(commands))
+        for (t, command), expected, actual in zip(commands, original, replayed):
+            if self._normalise(expected) != self._normalise(actual):
+                result.mismatches.append((t, command, expected, actual))
+
+        return result
+
+
+    ### INTERNAL FUNCTIONS
+    def _read_loop(self, received:list[str], reading:threading.Event) -> None:
+        while reading.is_set() or self.port.in_waiting:
+            if not self.port.in_waiting:
+                time.sleep(0.0005)
+                continue
+            line = self.port.readline().decode('ascii', errors='ignore').rstrip("\r\n")
+            if line:
+                received.append(line)
+        return
+
+    def _session_responses(self, events:list[telemetry.Event], t_from:float, t_to:float) -> tuple[list[tuple[float, str]], list[list[str]]]:
+        '''
+        The commands sent between t_from and t_to, and the response of each in the session.\r
+        The k-th prompt of the session answers its k-th command, counted over the whole session,
+        and a response is every received line since the previous prompt.
+
+        :param events: All TX and RX events of the session
+        :type events: list[telemetry.Event]
+        :return: (time, command) of the commands, and their responses
+        :rtype: tuple[list[tuple[float, str]], list[list[str]]]
+        '''
+        first = None                # index in the session of the first command of the window
+        commands = []
+        responses: dict[int, list[str]] = {}
+        sent = prompts = 0
+        for event in events:
+            if event.kind == telemetry.TX:
+                if t_from <= event.t <= t_to:
+                    if first is None:
+                        first = sent
+                    commands.append((event.t, event.text))
+                sent += 1
+            elif event.kind == telemetry.RX and first is not None:
+                if first <= prompts < first + len(commands):
+                    responses.setdefault(prompts, []).append(event.text)
+                elif prompts >= first + len(commands) and event.t > t_to:
+                    break
+            if event.kind == telemetry.RX and event.text.startswith(self.PROMPT):
+                prompts += 1
+        return commands, [responses.get(first + i, []) for i in range(len(commands))]
+
+    def _split_responses(self, lines:list[str], n_commands:int) -> list[list[str]]:
+        '''
+        Group the received lines into the responses to n_commands commands, each ending with the prompt.
+        Lines after the last expected prompt are added to the last response.
+        '''
+        responses = [[] for _ in range(n_commands)]
+        i = 0
+        for line in lines:
+            responses[min(i, n_commands - 1)].append(line)
+            if line.startswith(self.PROMPT):
+                i += 1
+        return responses
+
+    def _normalise(self, lines:list[str]) -> list[str]:
+        if self.compare_values:
+            return lines
+        return [NUMBER.sub("#", line) for line in lines]
+
+
+if __name__ == "__main__":
+    import sys
+    import serial
+    from simulated_drive import SimulatedDrive
+
+    # python replay.py <session.rclog> [speed] [port]
+    session_file = sys.argv[1]
+    speed = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+    port = serial.Serial(sys.argv[3], 115200, timeout=1) if len(sys.argv) > 3 else SimulatedDrive()
+
+    result = ReplayEngine(port, speed).run(session_file)
+    for line in result.summary():
+        print(line)
+    for t, command, expected, actual in result.mismatches[:20]:
+        print(f"{t:10.4f}  {command!r}: {expected} != {actual}")
+    port.close()
@@ -0,0 +1,189 @@
+import datetime
+import threading
+import time
+from typing import Callable
+
+import numpy as np
+
+import API_rotation_chair
+
+
+RECORDING_FOLDER = "../Recorded Data"
+COLUMN_CONVERSIONS = {                  # recorded unit -> deg or deg/s
+    "MECHANGLE": API_rotation_chair.counts2deg,
+    "PFB": API_rotation_chair.counts2deg,
+    "PCMD": API_rotation_chair.counts2deg,
+    "V": API_rotation_chair.rpm2degs,
+}
+
+
+class RollingRecorder:
+    """
+    Continuous acquisition beyond the 2000 points of one 'record' buffer.\r
+    Record windows are chained: arm and trigger a window, wait until it is full, download it with 'get',
+    and arm the next one straight away. The drive has a single record buffer, so the download time between
+    two windows is not sampled; those gaps are written into the file instead of being hidden.\r
+    Every sample is stamped on one continuous timeline, starting at the trigger of the first window.
+    """
+
+    # CONSTANT
+    MAX_POINTS = 2000           #[-] size of the record buffer of the drive
+    PROMPT = "-->"
+    MAX_EMPTY_READS = 5         #[-] consecutive empty reads (serial timeouts) before a download is given up
+
+    def __init__(self,
+                 send:Callable[[str], None],
+                 readline:Callable[[], str],
+                 sample_time:float,
+                 variables:list[str] = ["MECHANGLE", "V"],
+                 window_points:int = MAX_POINTS,
+                 file_name:str|None = None) -> None:
+        """
+        :param send: Function to send a command to the drive
+        :type send: Callable[[str], None]
+        :param readline: Function to read one line from the drive, "" on timeout
+        :type readline: Callable[[], str]
+        :param sample_time: Time between recorded points in [s]
+        :type sample_time: float
+        :param variables: Recorded variables, see "reclist"
+        :type variables: list[str]
+        :param window_points: Points per record window, 1 to 2000
+        :type window_points: int
+        """
+        if not 1 <= window_points <= self.MAX_POINTS:
+            raise ValueError(f"window_points should be between 1 and {self.MAX_POINTS}.")
+
+        self.send = send
+        self.readline = readline
+        self.sample_time = sample_time
+        self.variables = variables
+        self.window_points = window_points
+        self.file_name = file_name or RECORDING_FOLDER + f"/rolling_record_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+
+        self.stop_event = threading.Event()
+        self.windows = 0
+        self.t_zero = None              # time.monotonic() of the first trigger, time 0 of the file
+        self.gaps: list[tuple[float, float]] = []
+
+    ### EXTERNAL FUNCTIONS
+    def stop(self) -> None:
+        """
+        Finish the current window, download it and stop.
+        """
+        self.stop_event.set()
+        return
+
+    def run(self, total_time:float|None = None) -> str:
+        '''
+        Record until total_time has passed or stop() is called. Meant to be run in its own thread.
+
+        :param total_time: Duration of the acquisition in [s]. None to record until stop().
+        :type total_time: float | None
+        :return: The name of the created file
+        :rtype: str
+        '''
+        with open(self.file_name, 'w') as newfile:
+            newfile.write(f"Sampling Time: {self.sample_time}\t\tTotal Time: {total_time if total_time is not None else 'N/A'}\r")
+            newfile.write("# time\t" + "\t".join(self.variables) + "\r")
+
+        # set the record data to 'ascii' encode.
+        self.send("getmode 0")
+        variables = " ".join('"' + v for v in self.variables)
+
+        self.t_zero = None
+        t_covered = 0.0                 # [s] end of the samples written so far
+        while not self.stop_event.is_set():
+            points = self.window_points
+            if total_time is not None:
+                points = min(points, int(round((total_time - t_covered) / self.sample_time)))
+                if points <= 0:
+                    break
+
+            self.send(API_rotation_chair.record(self.sample_time, points, variables))
+            self.send(API_rotation_chair.trigger_record('"IMM'))
+            t_trigger = time.monotonic()
+            if self.t_zero is None:
+                self.t_zero = t_trigger
+            t_window = t_trigger - self.t_zero
+
+            self.stop_event.wait(points * self.sample_time)
+            rows = self._download()
+
+            with open(self.file_name, 'a') as newfile:
+                if t_window > t_covered + self.sample_time / 2:
+                    self.gaps.append((t_covered, t_window))
+                    newfile.write(f"# gap {t_covered:.6f} {t_window:.6f}\r")
+                for i, row in enumerate(rows):
+                    newfile.write(f"{t_window + i * self.sample_time:.6f}\t" + "\t".join(row) + "\r")
+
+            t_covered = max(t_covered, t_window + len(rows) * self.sample_time)
+            self.windows += 1
+
+        return self.file_name
+
+
+    ### INTERNAL FUNCTIONS
+    def _download(self) -> list[list[str]]:
+        '''
+        Send 'get' and collect the numeric rows until its prompt comes back.
+        The download starts at the echo of 'get', its header (exactly the variable names) or its first row;
+        prompts and lines before that belong to other commands (e.g. the echo of 'record' or the jogs of a
+        running motion) and are skipped.
+        '''
+        command = API_rotation_chair.get_recorded_data()
+        header = [v.upper() for v in self.variables]
+        self.send(command)
+
+        rows = []
+        started = False
+        empty_reads = 0
+        while empty_reads < self.MAX_EMPTY_READS:
+            line = self.readline().strip()
+            if not line:
+                empty_reads += 1
+                continue
+            empty_reads = 0
+            if line.startswith(self.PROMPT):
+                if started:
+                    break
+                continue
+
+            values = line.replace(",", " ").split()
+            try:
+                [float(v) for v in values]
+            except ValueError:
+                started = started or line.lower() == command or [v.strip('"').upper() for v in values] == header
+                continue
+            if len(values) == len(self.variables):
+                rows.append(values)
+                started = True
+
+        return rows
+
+
+def load_record(file_name:str, convert:bool = True) -> tuple[dict[str, np.ndarray], list[tuple[float, float]]]:
+    '''
+    Read a file written by RollingRecorder.\r
+    With convert, the angle columns (counts) are converted to deg and the velocity column (rpm) to deg/s,
+    a whole column at a time (see COLUMN_CONVERSIONS).
+
+    :param file_name: The file to read
+    :type file_name: str
+    :param convert: Convert the columns to deg and deg/s. False to keep the units of the drive.
+    :type convert: bool
+    :return: One array per column, "time" [s] included, and the gaps (start, end) [s]
+    :rtype: tuple[dict[str, np.ndarray], list[tuple[float, float]]]
+    '''
+    with open(file_name) as file:
+        lines = file.read().splitlines()
+
+    names = lines[1].lstrip("# ").split("\t")
+    gaps = [tuple(float(v) for v in line.split()[2:4]) for line in lines[2:] if line.startswith("# gap")]
+    data = np.loadtxt(lines[2:], comments="#", ndmin=2).reshape(-1, len(names))
+
+    columns = {name: data[:, i] for i, name in enumerate(names)}
+    if convert:
+        for name, conversion in COLUMN_CONVERSIONS.items():
+            if name in columns:
+                columns[name] = conversion(columns[name])
+    return columns, gaps
@@ -0,0 +1,259 @@
+import sys
+import threading
+import time
+from typing import Callable
+
+import API_rotation_chair
+
+
+class SafetySupervisor:
+    """
+    Stops the chair on request or when the motion leaves its envelope, independent of the Tk thread.\r
+    A dedicated thread waits for a stop request and writes the disable command straight to the port,
+    under the same lock as every other write, so at most one command that is already being written
+    goes before it. After a stop, motion commands are refused until reset().\r
+    The envelope is checked on every commanded velocity (max_speed) and on every velocity readback:
+    max_speed, the net angle integrated from the readbacks (max_angle), and a runaway when the readback
+    stays further than runaway_tolerance from the command for runaway_samples readbacks in a row.
+    """
+
+    # CONSTANT
+    SWITCH_INTERVAL = 0.0005    #[s] interpreter thread switch interval while armed
+    MOTION_COMMANDS = ("j", "moveabs", "moveinc")
+
+    def __init__(self,
+                 write:Callable[[str], None],
+                 write_lock:threading.Lock,
+                 max_speed:float = 180.0,
+                 max_angle:float = 360.0 * 25,
+                 runaway_tolerance:float = 60.0,
+                 runaway_samples:int = 3,
+                 on_stop:Callable[[str], None] = print,
+                 poll:Callable[[], None]|None = None,
+                 poll_period:float = 0.1) -> None:
+        """
+        :param write: Writes a command to the port, without taking write_lock
+        :type write: Callable[[str], None]
+        :param write_lock: The lock every write to the port is done under
+        :type write_lock: threading.Lock
+        :param max_speed: Maximum speed in [deg/s], commanded or measured
+        :param max_angle: Maximum net angle from the start of supervision in [deg]
+        :param runaway_tolerance: Allowed difference between measured and commanded speed in [deg/s]
+        :param runaway_samples: Number of readbacks in a row beyond the tolerance that count as a runaway
+        :param on_stop: Called with the reason after the stop command was written
+        :type on_stop: Callable[[str], None]
+        :param poll: Requests a velocity readback, called every poll_period while armed. None to not poll.
+        :type poll: Callable[[], None] | None
+        """
+        self.write = write
+        self.write_lock = write_lock
+        self.max_speed = max_speed
+        self.max_angle = max_angle
+        self.runaway_tolerance = runaway_tolerance
+        self.runaway_samples = runaway_samples
+        self.on_stop = on_stop
+        self.poll = poll
+        self.poll_period = poll_period
+
+        self.tripped = False
+        self.stops = 0              # stop requests so far, not cleared by reset()
+        self.armed = False
+        self.commanded = 0.0        #[deg/s]
+        self.angle = 0.0            #[deg] integrated from the readbacks
+        self.stop_latency: list[float] = []    #[s] request to written stop command
+        self._t_readback = None
+        self._off_command = 0
+        self._t_request = None
+        self._reason = ""
+        self._request = threading.Event()
+        self._running = True
+
+        self._switch_interval = None       # the interval to restore on disarm, None while disarmed
+        self.thread = threading.Thread(target=self._run, daemon=True, name="SafetySupervisor")
+        self.thread.start()
+
+    ### EXTERNAL FUNCTIONS
+    def emergency_stop(self, reason:str = "Emergency stop") -> None:
+        """
+        Request the stop. Returns immediately; the supervisor thread writes the stop command.
+        """
+        if self._t_request is None:
+            self._t_request = time.perf_counter()
+            self._reason = reason
+        self.stops += 1
+        self.tripped = True
+        self._request.set()
+        return
+
+    def reset(self) -> None:
+        """
+        Allow motion commands again, and restart the envelope (angle, runaway) from here.
+        """
+        self.tripped = False
+        self.commanded = 0.0
+        self.angle = 0.0
+        self._t_readback = None
+        self._off_command = 0
+        return
+
+    def arm(self, armed:bool = True) -> None:
+        """
+        Start/stop polling the readbacks (when a poll function is given).
+        While armed, the interpreter switches threads every SWITCH_INTERVAL, so a busy motion loop
+        cannot hold the supervisor thread off for the default 5 ms; the interval is restored on disarm.
+        """
+        if armed and self._switch_interval is None:
+            self._switch_interval = sys.getswitchinterval()
+            sys.setswitchinterval(min(self._switch_interval, self.SWITCH_INTERVAL))
+        elif not armed and self._switch_interval is not None:
+            sys.setswitchinterval(self._switch_interval)
+            self._switch_interval = None
+        self.armed = armed
+        return
+
+    def allows(self, command:str) -> bool:
+        """
+        Whether a command may be written: motion commands are refused after a stop until reset().
+        """
+        return not (self.tripped and command.split(" ", 1)[0].lower() in self.MOTION_COMMANDS)
+
+    def check_command(self, speed:float) -> bool:
+        """
+        Check a commanded speed in [deg/s] before it is sent.
+
+        :return: Whether it may be sent
+        :rtype: bool
+        """
+        if self.tripped:
+            return False
+        if abs(speed) > self.max_speed:
+            self.emergency_stop(f"Commanded speed {speed:.1f} deg/s beyond {self.max_speed} deg/s")
+            return False
+        self.commanded = speed
+        return True
+
+    def on_readback(self, speed:float) -> None:
+        """
+        Check a measured speed in [deg/s].
+        """
+        now = time.perf_counter()
+        if self._t_readback is not None:
+            self.angle += speed * (now - self._t_readback)
+        self._t_readback = now
+
+        if abs(speed) > self.max_speed:
+            self.emergency_stop(f"Measured speed {speed:.1f} deg/s beyond {self.max_speed} deg/s")
+        elif abs(self.angle) > self.max_angle:
+            self.emergency_stop(f"Angle {self.angle:.0f} deg beyond {self.max_angle} deg")
+
+        if abs(speed - self.commanded) > self.runaway_tolerance:
+            self._off_command += 1
+            if self._off_command >= self.runaway_samples:
+                self.emergency_stop(f"Runaway: measured {speed:.1f} deg/s, commanded {self.commanded:.1f} deg/s")
+        else:
+            self._off_command = 0
+        return
+
+    def close(self) -> None:
+        self._running = False
+        self._request.set()
+        self.thread.join()
+        self.arm(False)
+        return
+
+
+    ### INTERNAL FUNCTIONS
+    def _run(self) -> None:
+        next_poll = time.perf_counter()
+        while self._running:
+            # Disarmed, the thread still wakes every poll_period, so arm() needs no wake up of its own
+            polling = self.armed and self.poll is not None
+            timeout = max(0.0, next_poll - time.perf_counter()) if polling else self.poll_period
+            if not self._request.wait(timeout):
+                if not (polling and self.armed):
+                    next_poll = time.perf_counter()
+                    continue
+                next_poll = max(next_poll + self.poll_period, time.perf_counter())     # no burst after a late poll
+                try:
+                    with self.write_lock:
+                        self.poll()
+                except Exception:
+                    pass
+                continue
+            if not self._running:
+                return
+
+            self._request.clear()
+            with self.write_lock:
+                try:
+                    self.write(API_rotation_chair.disable_motor())
+                except Exception as e:
+                    self._reason += f" (stop write failed: {e})"
+            if self._t_request is not None:
+                self.stop_latency.append(time.perf_counter() - self._t_request)
+            reason, self._t_request = self._reason, None
+            self.arm(False)
+            self.on_stop(reason)
+            next_poll = time.perf_counter()
+        return
+
+
+def measure_stop_latency(n_stops:int = 200) -> list[float]:
+    '''
+    Stop latency of an armed supervisor on a simulated drive while a motion loop keeps the interpreter busy:
+    the time from emergency_stop() to the stop command arriving at the drive.
+
+    :param n_stops: Number of stops to measure
+    :return: The latencies in [s], sorted
+    :rtype: list[float]
+    '''
+    import random
+    from simulated_drive import SimulatedDrive
+
+    drive = SimulatedDrive(timeout=0.05)
+    lock = threading.Lock()
+    supervisor = SafetySupervisor(lambda c: drive.write((c + '\r').encode('ascii')), lock, on_stop=lambda reason: None)
+    for command in ["opmode 0", "en", "echo 0"]:
+        drive.write((command + '\r').encode('ascii'))
+
+    running = True
+    def motion_loop() -> None:
+        next_time = time.perf_counter()
+        while running:
+            with lock:
+                if supervisor.allows("j 1"):
+                    drive.write(b"j 1.5\r")
+            next_time += 0.02
+            while time.perf_counter() < next_time:  pass      # spin like the motion loop
+    def drain() -> None:
+        while running:
+            drive.readline()
+    threading.Thread(target=motion_loop, daemon=True).start()
+    threading.Thread(target=drain, daemon=True).start()
+
+    latencies = []
+    try:
+        for _ in range(n_stops):
+            supervisor.reset()
+            while supervisor.armed:  time.sleep(0.0001)        # the previous stop disarms
+            supervisor.arm()
+            time.sleep(random.uniform(0.005, 0.02))
+            n_received = len(drive.received)
+            t_request = time.monotonic()
+            supervisor.emergency_stop("test")
+            while not any(c == "k" for _, c in drive.received[n_received:]):
+                time.sleep(0.0001)
+            t_stop = next(t for t, c in drive.received[n_received:] if c == "k")
+            latencies.append(t_stop - t_request)
+    finally:
+        running = False
+        supervisor.close()
+        drive.close()
+    return sorted(latencies)
+
+
+if __name__ == "__main__":
+    # Worst-case stop latency while a motion loop keeps the interpreter busy
+    latencies = measure_stop_latency()
+    print(f"Stop latency over {len(latencies)} stops: median {latencies[len(latencies)//2]*1000:.3f} ms, "
+          f"99% {latencies[int(len(latencies)*0.99)]*1000:.3f} ms, worst {latencies[-1]*1000:.3f} ms")
@@ -0,0 +1,353 @@
+import collections
+import queue
+import threading
+import time
+from typing import Callable
+
+import serial
+
+import API_rotation_chair
+import link_optimizer
+from simulated_drive import SimulatedDrive
+
+
+class DeviceEndpoint:
+    """
+    One serial device with its own reader thread and write queue.\r
+    Commands can be queued to be written as soon as possible, or at a due time on the monotonic clock;
+    the writer sleeps until shortly before the due time and spins for the rest.\r
+    stop() is the priority path: it drops every queued command and writes the disable command at once.
+    """
+
+    # CONSTANT
+    SPIN_TIME = 0.002           #[s] the last part of a wait is spun instead of slept
+    STATS_WINDOW = 10000        #[-] latest commands kept for the latency statistics and the skew
+    PROMPT = "-->"
+
+    def __init__(self,
+                 name:str,
+                 port,
+                 on_line:Callable[[str, str], None]|None = None,
+                 on_written:Callable[[str, float, float], None]|None = None) -> None:
+        """
+        :param name: Name of the device in the session
+        :type name: str
+        :param port: An open serial.Serial or SimulatedDrive
+        :param on_line: Called with (name, line) for every line received
+        :type on_line: Callable[[str, str], None] | None
+        :param on_written: Called with (name, due, written) for every timed command written
+        :type on_written: Callable[[str, float, float], None] | None
+        """
+        self.name = name
+        self.port = port
+        self.on_line = on_line
+        self.on_written = on_written
+        self.queue = queue.Queue()
+        self.running = True
+        self.write_lock = threading.Lock()
+        self._generation = 0            # raised by stop() and close(): queued commands of an older one are dropped
+        self._wake = threading.Event()  # ends the wait of the writer for a due time
+
+        self.commands_out = 0
+        self.bytes_out = 0
+        self.lines_in = 0
+        self.bytes_in = 0
+        self.queue_latency = collections.deque(maxlen=self.STATS_WINDOW)        # [s] enqueue (or due time) to write
+        self.response_latency = collections.deque(maxlen=self.STATS_WINDOW)     # [s] write to prompt
+        self.scheduled = collections.deque(maxlen=self.STATS_WINDOW)            # (due, written) of the timed commands
+        self._awaiting_prompt = queue.SimpleQueue()
+        self.t_start = time.monotonic()
+
+        self.writer = threading.Thread(target=self._write_loop, daemon=True)
+        self.reader = threading.Thread(target=self._read_loop, daemon=True)
+        self.writer.start()
+        self.reader.start()
+
+    ### EXTERNAL FUNCTIONS
+    def send(self, command:str, due:float|None = None) -> None:
+        """
+        Queue a command.
+
+        :param due: time.monotonic() at which it is written. None for as soon as possible.
+        :type due: float | None
+        """
+        self.queue.put((command, time.monotonic(), due, self._generation))
+        return
+
+    def stop(self) -> None:
+        """
+        Drop every queued command, the timed ones included, and write the disable command straight away,
+        ahead of anything but a command that is being written.
+        """
+        self._cancel()
+        with self.write_lock:
+            try:
+                self._write(API_rotation_chair.disable_motor())
+            except Exception as e:
+                print(f"{self.name} stop write error: {e}")
+        return
+
+    def close(self, cancel:bool = True) -> None:
+        """
+        :param cancel: Drop the commands still queued. False to write them first, which waits for the last due time.
+        :type cancel: bool
+        """
+        self.running = False
+        if cancel:
+            self._cancel()
+        self.queue.put(None)
+        self.writer.join()
+        self.port.close()
+        self.reader.join(timeout=2)
+        return
+
+    def stats(self) -> dict[str, float]:
+        elapsed = time.monotonic() - self.t_start
+        return {
+            "commands/s": self.commands_out / elapsed,
+            "bytes out/s": self.bytes_out / elapsed,
+            "bytes in/s": self.bytes_in / elapsed,
+            "queue depth": self.queue.qsize(),
+            "queue latency mean [ms]": _mean(self.queue_latency) * 1000,
+            "queue latency max [ms]": max(self.queue_latency, default=0.0) * 1000,
+            "response latency mean [ms]": _mean(self.response_latency) * 1000,
+            "response latency max [ms]": max(self.response_latency, default=0.0) * 1000,
+        }
+
+
+    ### INTERNAL FUNCTIONS
+    def _cancel(self) -> None:
+        self._generation += 1           # before the wake up, see _write_loop
+        self._wake.set()
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def _write(self, command:str) -> float:
+        data = (command + '\r').encode('ascii')
+        t_written = time.monotonic()
+        self.port.write(data)
+        self._awaiting_prompt.put(t_written)
+        self.commands_out += 1
+        self.bytes_out += len(data)
+        return t_written
+
+    def _write_loop(self) -> None:
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            command, t_enqueue, due, generation = item
+
+            if due is not None:
+                remaining = due - time.monotonic()
+                if remaining > self.SPIN_TIME:
+                    # cleared before the generation is checked, so a cancel in between still ends the wait
+                    self._wake.clear()
+                    if generation == self._generation:
+                        self._wake.wait(remaining - self.SPIN_TIME)
+                while time.monotonic() < due and generation == self._generation:  pass
+
+            with self.write_lock:
+                if generation != self._generation:
+                    continue                # cancelled while waiting
+                try:
+                    t_written = self._write(command)
+                except Exception as e:
+                    print(f"{self.name} write error: {e}")
+                    continue
+
+            self.queue_latency.append(t_written - (t_enqueue if due is None else max(due, t_enqueue)))
+            if due is not None:
+                self.scheduled.append((due, t_written))
+                if self.on_written:
+                    self.on_written(self.name, due, t_written)
+
+    def _read_loop(self) -> None:
+        while self.running:
+            try:
+                data = self.port.readline()
+            except Exception as e:
+                if self.running:
+                    print(f"{self.name} read error: {e}")
+                return
+            if not data:
+                continue
+            t_read = time.monotonic()
+            self.bytes_in += len(data)
+            self.lines_in += 1
+            line = data.decode('ascii', errors='ignore').strip()
+
+            if line.startswith(self.PROMPT):
+                try:
+                    self.response_latency.append(t_read - self._awaiting_prompt.get_nowait())
+                except queue.Empty:
+                    pass
+            if self.on_line:
+                self.on_line(self.name, line)
+
+
+class SessionManager:
+    """
+    Owns several serial devices and starts command streams on them on one shared clock.\r
+    Every stream is handed to the writer of its device with absolute due times, so the devices do not
+    wait on each other; the skew between them is the difference between their actual write times.
+    A tick whose skew exceeds max_skew is counted in skew_failures and reported to on_skew, which can
+    stop() the session.
+    """
+
+    # CONSTANT
+    LEAD_TIME = 0.2             #[s] time between scheduling a start and the first command
+    MAX_SKEW = 0.002            #[s] skew of a tick beyond which it counts as a failure
+
+    def __init__(self,
+                 on_line:Callable[[str, str], None]|None = None,
+                 max_skew:float = MAX_SKEW,
+                 on_skew:Callable[[str], None] = print) -> None:
+        """
+        :param on_line: Called with (device name, line) for every line received
+        :type on_line: Callable[[str, str], None] | None
+        :param max_skew: Allowed skew of a tick in [s]
+        :param on_skew: Called with a message for every tick beyond max_skew, from the writer thread of a device
+        :type on_skew: Callable[[str], None]
+        """
+        self.on_line = on_line
+        self.max_skew = max_skew
+        self.on_skew = on_skew
+        self.devices: dict[str, DeviceEndpoint] = {}
+        self.skew_failures = 0
+        self._ticks: dict[float, list] = {}     # due -> [first write, last write, devices written] of the running start
+        self._stream_devices = 0
+        self._ticks_lock = threading.Lock()
+
+    ### EXTERNAL FUNCTIONS
+    def open(self, name:str, port:str, baudrate:int = 115200, timeout:float = 1.0) -> DeviceEndpoint:
+        '''
+        Open a serial port (or SimulatedDrive.PORT) as a device of the session.
+        '''
+        if name in self.devices:
+            raise ValueError(f"Device {name} is already open.")
+        if port == SimulatedDrive.PORT:
+            connection = SimulatedDrive(timeout=timeout)
+        else:
+            connection = serial.Serial(port=port, baudrate=baudrate, bytesize=8, parity='N', stopbits=1, timeout=timeout)
+        return self.add(name, connection)
+
+    def add(self, name:str, connection) -> DeviceEndpoint:
+        self.devices[name] = DeviceEndpoint(name, connection, self.on_line, self._on_written)
+        return self.devices[name]
+
+    def send(self, name:str, command:str) -> None:
+        self.devices[name].send(command)
+        return
+
+    def start_synchronised(self, streams:dict[str, list[str]], delta_t:float, lead_time:float = LEAD_TIME) -> float:
+        '''
+        Start command streams on several devices at the same moment, one command per delta_t.\r
+        The streams are compacted (see link_optimizer.compact_stream), and the echo of a device is
+        switched off around its stream when the echo would not fit on the line at that rate.
+
+        :param streams: Commands per device name
+        :type streams: dict[str, list[str]]
+        :param delta_t: Time between the commands of a stream in [s]
+        :type delta_t: float
+        :return: The start time on the time.monotonic() clock
+        :rtype: float
+        '''
+        t_zero = time.monotonic() + lead_time
+        with self._ticks_lock:
+            self._ticks.clear()
+            self._stream_devices = len(streams)
+        for name, commands in streams.items():
+            device = self.devices[name]
+            device.scheduled.clear()
+            stream = link_optimizer.compact_stream(commands)
+            quiet = link_optimizer.stream_needs_quiet(stream, delta_t, device.port.baudrate)
+            if quiet:
+                device.send(API_rotation_chair.quiet())
+            for i, command in enumerate(stream):
+                if command is not None:
+                    device.send(command, t_zero + i * delta_t)
+            if quiet:
+                device.send(API_rotation_chair.dequiet())
+        return t_zero
+
+    def skew(self, names:list[str]|None = None) -> tuple[float, float]:
+        '''
+        Skew of the last synchronised start: per tick, the spread of the write times over the devices.
+
+        :return: Mean and maximum skew in [s]
+        :rtype: tuple[float, float]
+        '''
+        names = names or list(self.devices)
+        written = [dict(self.devices[name].scheduled) for name in names]
+        ticks = set.intersection(*(set(w) for w in written)) if written else set()
+        if len(names) < 2 or not ticks:
+            return 0.0, 0.0
+        spread = [max(w[due] for w in written) - min(w[due] for w in written) for due in ticks]
+        return _mean(spread), max(spread)
+
+    def report(self) -> dict[str, dict[str, float]]:
+        return {name: device.stats() for name, device in self.devices.items()}
+
+    def stop(self) -> None:
+        '''
+        Priority stop of every device: the queued streams are dropped and the disable command is written at once.
+        '''
+        for device in self.devices.values():
+            device.stop()
+        return
+
+    def close(self, cancel:bool = True) -> None:
+        '''
+        :param cancel: Drop the commands still queued. False to write them first.
+        :type cancel: bool
+        '''
+        for device in self.devices.values():
+            device.close(cancel)
+        self.devices.clear()
+        return
+
+
+    ### INTERNAL FUNCTIONS
+    def _on_written(self, name:str, due:float, written:float) -> None:
+        with self._ticks_lock:
+            tick = self._ticks.setdefault(due, [written, written, 0])
+            tick[0], tick[1], tick[2] = min(tick[0], written), max(tick[1], written), tick[2] + 1
+            if tick[2] < self._stream_devices:
+                return
+            del self._ticks[due]
+            skew = tick[1] - tick[0]
+            if skew <= self.max_skew:
+                return
+            self.skew_failures += 1
+        self.on_skew(f"Skew {skew*1e6:.0f} us beyond {self.max_skew*1e6:.0f} us at the tick due {due:.4f} s, last written by {name}")
+        return
+
+
+def _mean(values:list[float]|collections.deque) -> float:
+    return sum(values) / len(values) if values else 0.0
+
+
+if __name__ == "__main__":
+    from keshner_motion import KeshnerMotion
+
+    manager = SessionManager()
+    for name in ["chair", "aux"]:
+        manager.open(name, SimulatedDrive.PORT, timeout=0.1)
+        for command in ["k", API_rotation_chair.opmode(0), "en", API_rotation_chair.quiet()]:
+            manager.send(name, command)
+
+    delta_t = 0.01
+    stream = API_rotation_chair.jogging_table(KeshnerMotion(delta_t, total_time=5).exact_positions(), delta_t)
+    t_zero = manager.start_synchronised({"chair": stream, "aux": stream}, delta_t)
+    time.sleep(t_zero - time.monotonic() + len(stream) * delta_t + 0.2)
+
+    mean_skew, max_skew = manager.skew()
+    print(f"{len(stream)} ticks of {delta_t} s, skew mean {mean_skew*1e6:.0f} us, max {max_skew*1e6:.0f} us, "
+          f"{manager.skew_failures} ticks beyond {manager.max_skew*1e6:.0f} us")
+    for name, stats in manager.report().items():
+        print(name + ": " + ", ".join(f"{k} {v:.2f}" for k, v in stats.items()))
+    manager.close()
@@ -0,0 +1,255 @@
+import threading
+import time
+
+import API_rotation_chair
+
+
+class SimulatedDrive:
+    """
+    A stand-in for the serial port of the drive, to run the interface and its tools without the chair.\r
+    It implements the part of the pyserial interface that is used (write, readline, in_waiting, close)
+    and answers the commands of API_rotation_chair: every command is echoed (unless 'echo 0'),
+    followed by its response lines and the prompt on its own line.\r
+    The motion is integrated on the host clock: jogging ramps with acc/dec in velocity mode (opmode 0),
+    moves run at their velocity in position mode (opmode 8). Velocities are in rpm, angles in counts.
+    """
+
+    # CONSTANT
+    PORT = "SIM"                # name in the port list of the interface
+    PROMPT = "-->"
+    RECORD_UNIT = 31.25e-6      #[s] time unit of the 'record' sampling time
+    BAUD_RATES = (115200, 230400, 460800, 921600)
+
+    def __init__(self, timeout:float = 1.0, response_delay:float = 0.0, emulate_baudrate:bool = False, switches_baud:bool = False) -> None:
+        """
+        :param timeout: Time readline waits for a full line in [s], like serial.Serial
+        :type timeout: float
+        :param response_delay: Extra processing time of every command in [s]
+        :type response_delay: float
+        :param emulate_baudrate: Delay writes and reads by their transmission time at baudrate (8N1)
+        :type emulate_baudrate: bool
+        :param switches_baud: Accept link_optimizer.BAUD_COMMAND. The command is not verified on the drive,
+            so by default it is refused like an unknown command.
+        :type switches_baud: bool
+        """
+        self.timeout = timeout
+        self.response_delay = response_delay
+        self.emulate_baudrate = emulate_baudrate
+        self.is_open = True
+        self.port = self.PORT
+        self.switches_baud = switches_baud
+        self.baudrate = 115200      # of the port; what is written at another rate than the drive's is lost
+        self.drive_baudrate = 115200
+
+        self._output = bytearray()
+        self._input = bytearray()
+        self._condition = threading.Condition()
+
+        self.echo = True
+        self.enabled = False
+        self.opmode = 8
+        self.acc = 1000.0           #[rpm/s]
+        self.dec = 1000.0           #[rpm/s]
+        self.velocity = 0.0         #[rpm]
+        self.position = 0.0         #[counts]
+        self.jog_target = 0.0       #[rpm]
+        self.move_target = None     #[counts]
+        self.move_speed = 0.0       #[rpm]
+        self.record_setup = None    # (sampling time [s], number of points, variables)
+        self.record_start = None
+        self.recording: list[tuple[float, float]] = []
+        self.received: list[tuple[float, str]] = []     # (monotonic time, command)
+        self._t_last = time.monotonic()
+
+    ### SERIAL INTERFACE
+    @property
+    def in_waiting(self) -> int:
+        with self._condition:
+            return len(self._output)
+
+    def write(self, data:bytes) -> int:
+        self._transmit(len(data))
+        with self._condition:
+            if self.baudrate != self.drive_baudrate:
+                return len(data)
+            self._input += data
+            while b"\r" in self._input:
+                line, _, rest = self._input.partition(b"\r")
+                self._input = bytearray(rest)
+                self._execute(line.decode("ascii", errors="ignore").strip())
+            self._condition.notify_all()
+        return len(data)
+
+    def readline(self) -> bytes:
+        deadline = time.monotonic() + self.timeout
+        with self._condition:
+            while b"\n" not in self._output:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self.is_open:
+                    line = bytes(self._output)
+                    self._output.clear()
+                    return line
+                self._condition.wait(remaining)
+            line, _, rest = self._output.partition(b"\n")
+            self._output = bytearray(rest)
+        self._transmit(len(line) + 1)
+        return line + b"\n"
+
+    def reset_input_buffer(self) -> None:
+        with self._condition:
+            self._output.clear()
+        return
+
+    def flush(self) -> None:
+        return
+
+    def close(self) -> None:
+        with self._condition:
+            self.is_open = False
+            self._condition.notify_all()
+        return
+
+
+    def _transmit(self, n_bytes:int) -> None:
+        if self.emulate_baudrate:
+            time.sleep(n_bytes * 10 / self.baudrate)
+        return
+
+
+    ### DRIVE
+    def _respond(self, *lines:str) -> None:
+        for line in lines:
+            self._output += (line + "\r\n").encode("ascii")
+        return
+
+    def _execute(self, command:str) -> None:
+        now = time.monotonic()
+        self._update(now)
+        self.received.append((now, command))
+        if self.response_delay:
+            time.sleep(self.response_delay)
+        if self.echo and command:
+            self._respond(command)
+
+        words = command.split()
+        name = words[0].lower() if words else ""
+        args = words[1:]
+        try:
+            self._respond(*self._handle(name, args, now))
+        except (ValueError, IndexError):
+            self._respond("Invalid Value")
+        self._respond(self.PROMPT)
+        return
+
+    def _handle(self, name:str, args:list[str], now:float) -> list[str]:
+        if name == "":
+            return []
+        if name == "echo":
+            self.echo = args[0] == "1"
+            return []
+        if name == "baud":
+            if not self.switches_baud:
+                return ["Unknown Command"]
+            if int(args[0]) not in self.BAUD_RATES:
+                return ["Invalid Value"]
+            self.drive_baudrate = int(args[0])
+            return []
+        if name == "en":
+            self.enabled = True
+            return []
+        if name == "k":
+            self.enabled = False
+            self.velocity = self.jog_target = 0.0
+            self.move_target = None
+            return []
+        if name == "opmode":
+            if not args:
+                return [str(self.opmode)]
+            if self.enabled:
+                return ["Drive Active"]
+            self.opmode = int(args[0])
+            return []
+        if name in ("acc", "dec"):
+            if not args:
+                return [f"{getattr(self, name):.3f} [rpm/s]"]
+            setattr(self, name, float(args[0]))
+            return []
+        if name == "j":
+            if not self.enabled or self.opmode != 0:
+                return ["Drive Inactive" if not self.enabled else "Wrong Opmode"]
+            self.jog_target = float(args[0])
+            return []
+        if name in ("moveabs", "moveinc"):
+            if not self.enabled or self.opmode != 8:
+                return ["Drive Inactive" if not self.enabled else "Wrong Opmode"]
+            target = float(args[0])
+            self.move_target = target if name == "moveabs" else (self.move_target or self.position) + target
+            self.move_speed = abs(float(args[1]))
+            return []
+        if name == "v":
+            return [f"{self.velocity:.3f} [rpm]"]
+        if name in ("pfb", "mechangle"):
+            return [f"{self.position:.0f} [counts]"]
+        if name == "record":
+            variables = [v.strip('"') for v in args[2:]]
+            self.record_setup = (int(args[0]) * self.RECORD_UNIT, int(args[1]), variables)
+            self.record_start = None
+            return []
+        if name == "rectrig":
+            self.record_start = now
+            self.recording = []
+            return []
+        if name == "get":
+            return self._recorded_lines()
+        # getmode, knli, delay and the rest are accepted as they are
+        return []
+
+    def _update(self, now:float) -> None:
+        '''
+        Integrate the motion up to now, in steps of the record sampling time while recording.
+        '''
+        while self._t_last < now:
+            dt = now - self._t_last
+            recording = self.record_setup and self.record_start is not None and len(self.recording) < self.record_setup[1]
+            if recording:
+                sampling_time = self.record_setup[0]
+                t_sample = self.record_start + len(self.recording) * sampling_time
+                if t_sample <= self._t_last:
+                    self.recording.append((self.position, self.velocity))
+                    continue
+                dt = min(dt, t_sample - self._t_last)
+            self._integrate(dt)
+            self._t_last += dt
+        return
+
+    def _integrate(self, dt:float) -> None:
+        if self.enabled and self.opmode == 0:
+            delta = self.jog_target - self.velocity
+            speeding_up = delta * self.velocity >= 0
+            step = (self.acc if speeding_up else self.dec) * dt
+            new_velocity = self.jog_target if abs(delta) <= step else self.velocity + step * (1 if delta > 0 else -1)
+            self.position += (self.velocity + new_velocity) / 2 * dt * API_rotation_chair.RES_TOTAL / 60
+            self.velocity = new_velocity
+        elif self.enabled and self.opmode == 8 and self.move_target is not None:
+            remaining = self.move_target - self.position
+            step = self.move_speed * dt * API_rotation_chair.RES_TOTAL / 60
+            if abs(remaining) <= step:
+                self.position = self.move_target
+                self.move_target = None
+                self.velocity = 0.0
+            else:
+                self.position += step if remaining > 0 else -step
+                self.velocity = self.move_speed if remaining > 0 else -self.move_speed
+        else:
+            self.velocity = 0.0
+        return
+
+    def _recorded_lines(self) -> list[str]:
+        if not self.record_setup:
+            return ["Record not set up"]
+        _, _, variables = self.record_setup
+        columns = {"MECHANGLE": 0, "PFB": 0, "PCMD": 0, "V": 1}
+        lines = [" ".join(variables)]
+        for sample in self.recording:
+            lines.append(", ".join(f"{sample[columns.get(v.upper(), 1)]:.3f}" for v in variables))
+        return lines
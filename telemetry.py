@@ -0,0 +1,203 @@
+import datetime
+import os
+import queue
+import struct
+import threading
+import time
+from typing import Callable, Iterator, NamedTuple
+
+
+LOG_FOLDER = "../Session Logs"
+
+# Event kinds
+TX = 1          # command sent to the drive
+RX = 2          # line received from the drive
+STATE = 3       # state change of the interface, "name=value"
+TIMING = 4      # timing event of a motion, free text
+NOTE = 5        # anything else worth keeping
+KIND_NAMES = {TX: "TX", RX: "RX", STATE: "STATE", TIMING: "TIMING", NOTE: "NOTE"}
+
+# File layout: header, then records of (time since start [ns], kind, payload length) + utf-8 payload
+MAGIC = b"TUDRCLOG"
+VERSION = 1
+HEADER = struct.Struct("<8sHdQ")        # magic, version, wall-clock start [s since epoch], monotonic start [ns]
+RECORD = struct.Struct("<QBH")
+
+
+class Event(NamedTuple):
+    t: float        # [s] since the start of the session
+    kind: int
+    text: str
+
+
+class TelemetryLog:
+    """
+    Per-session append-only binary log of everything that goes over the link.\r
+    log() only stamps the event and puts it in a queue, so it is cheap enough for the control path;
+    a background thread packs the events in batches and appends them to the file.
+    """
+
+    # CONSTANT
+    BATCH_SIZE = 256            #[-] maximum events packed per write
+    FLUSH_INTERVAL = 0.5        #[s] maximum time an event stays in the file buffer
+
+    def __init__(self, file_name:str|None = None) -> None:
+        """
+        :param file_name: The log file, which must not exist yet. None for a new file in LOG_FOLDER.
+        :type file_name: str | None
+        """
+        # A session never appends to the file of another one: a second header would be read as records
+        if file_name is None:
+            os.makedirs(LOG_FOLDER, exist_ok=True)
+            base = LOG_FOLDER + f"/session_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
+            n = 0
+            while True:
+                file_name = base + (f"_{n}" if n else "") + ".rclog"
+                try:
+                    self.file = open(file_name, 'xb')
+                    break
+                except FileExistsError:
+                    n += 1
+        else:
+            self.file = open(file_name, 'xb')
+        self.file_name = file_name
+
+        self.t_zero = time.monotonic_ns()
+        self.queue = queue.SimpleQueue()
+        self.events_written = 0
+
+        self.file.write(HEADER.pack(MAGIC, VERSION, time.time(), self.t_zero))
+        self.writer = threading.Thread(target=self._write_loop, daemon=True)
+        self.writer.start()
+
+    ### EXTERNAL FUNCTIONS
+    def log(self, kind:int, text:str) -> None:
+        """
+        Append an event to the log. Thread-safe and non-blocking.
+
+        :param kind: TX, RX, STATE, TIMING or NOTE
+        :type kind: int
+        :param text: The content of the event
+        :type text: str
+        """
+        self.queue.put((time.monotonic_ns(), kind, text))
+        return
+
+    def close(self) -> None:
+        """
+        Write the remaining events and close the file.
+        """
+        self.queue.put(None)
+        self.writer.join()
+        return
+
+    def pending(self) -> int:
+        return self.queue.qsize()
+
+
+    ### INTERNAL FUNCTIONS
+    def _write_loop(self) -> None:
+        last_flush = time.monotonic()
+        running = True
+        while running:
+            try:
+                batch = [self.queue.get(timeout=self.FLUSH_INTERVAL)]
+            except queue.Empty:
+                batch = []
+            while batch and len(batch) < self.BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            if None in batch:
+                running = False
+                batch = [event for event in batch if event is not None]
+
+            buffer = bytearray()
+            for t_ns, kind, text in batch:
+                payload = text.encode("utf-8")[:0xFFFF]
+                buffer += RECORD.pack(t_ns - self.t_zero, kind, len(payload))
+                buffer += payload
+            if buffer:
+                self.file.write(buffer)
+                self.events_written += len(batch)
+
+            if not running or time.monotonic() - last_flush > self.FLUSH_INTERVAL:
+                self.file.flush()
+                last_flush = time.monotonic()
+
+        self.file.close()
+        return
+
+
+def read_header(file_name:str) -> tuple[float, int]:
+    '''
+    :return: Wall-clock time of the start of the session [s since epoch], and the monotonic start [ns]
+    :rtype: tuple[float, int]
+    '''
+    with open(file_name, 'rb') as file:
+        magic, version, t_wall, t_zero = HEADER.unpack(file.read(HEADER.size))
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{file_name} is not a session log of version {VERSION}.")
+    return t_wall, t_zero
+
+
+def read_session(file_name:str,
+                 kinds:set[int]|None = None,
+                 t_from:float = 0.0,
+                 t_to:float = float("inf"),
+                 contains:str|None = None) -> Iterator[Event]:
+    '''
+    Read the events of a session log, optionally filtered.\r
+    Payloads of events filtered out by kind or time are not decoded.
+
+    :param kinds: Only these kinds of events. None for all.
+    :type kinds: set[int] | None
+    :param t_from: Only events from this time on, in [s] since the start of the session
+    :param t_to: Only events up to this time, in [s] since the start of the session
+    :param contains: Only events whose text contains this string
+    :type contains: str | None
+    '''
+    read_header(file_name)
+    with open(file_name, 'rb') as file:
+        data = file.read()
+
+    ns_from, ns_to = t_from * 1e9, t_to * 1e9
+    offset = HEADER.size
+    while offset + RECORD.size <= len(data):
+        t_ns, kind, length = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        if t_ns > ns_to:
+            break
+        if (kinds is None or kind in kinds) and t_ns >= ns_from:
+            text = data[offset:offset+length].decode("utf-8", errors="replace")
+            if contains is None or contains in text:
+                yield Event(t_ns / 1e9, kind, text)
+        offset += length
+    return
+
+
+def replay(events:Iterator[Event], callback:Callable[[Event], None], speed:float = 1.0) -> None:
+    '''
+    Call back every event at its original pace, or speed times faster.
+
+    :param speed: Replay speed factor, float("inf") for as fast as possible
+    :type speed: float
+    '''
+    t_start = None
+    for event in events:
+        if t_start is None:
+            t_start = time.monotonic() - event.t / speed
+        delay = t_start + event.t / speed - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        callback(event)
+    return
+
+
+if __name__ == "__main__":
+    import sys
+
+    for event in read_session(sys.argv[1]):
+        print(f"{event.t:12.6f}  {KIND_NAMES.get(event.kind, event.kind):6}  {event.text}")
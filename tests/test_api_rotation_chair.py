@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+import API_rotation_chair
+from keshner_motion import KeshnerMotion
+
+QUANTUM = 0.01          # [rpm] resolution of the jog velocity
+
+
+@pytest.mark.parametrize("sampling_time", [0.002, 0.005, 0.02])
+def test_jogged_angle_stays_within_one_quantum(sampling_time):
+    motion = KeshnerMotion(sampling_time, use_cache=False)
+    position = motion.exact_positions()
+    rpm = API_rotation_chair.quantised_rpm_table(position, sampling_time)
+    assert np.allclose(rpm * 100, np.rint(rpm * 100))
+
+    jogged = np.cumsum(API_rotation_chair.rpm2degs(rpm)) * sampling_time           # [deg] at the end of each step
+    target = position[1:] - position[0]
+    bound = float(API_rotation_chair.rpm2degs(QUANTUM)) * sampling_time
+    assert np.abs(jogged[:-1] - target).max() <= bound
+
+
+@pytest.mark.parametrize("sampling_time", [0.002, 0.005])
+def test_jogs_add_no_acceleration_spikes(sampling_time):
+    motion = KeshnerMotion(sampling_time, use_cache=False)
+    position = motion.exact_positions()
+    speed = API_rotation_chair.rpm2degs(API_rotation_chair.quantised_rpm_table(position, sampling_time))
+    acc = np.abs(np.diff(speed)) / sampling_time
+    true_acc = np.abs(np.diff(np.diff(position))) / sampling_time ** 2
+    step = float(API_rotation_chair.rpm2degs(QUANTUM)) / sampling_time      # one velocity quantum within a step
+    assert acc.max() <= true_acc.max() + 2 * step
+
+
+def test_jogs_lead_speed_table_by_half_a_step():
+    dt = 0.002
+    motion = KeshnerMotion(dt, total_time=20, use_cache=False)
+    speed = API_rotation_chair.rpm2degs(API_rotation_chair.quantised_rpm_table(motion.exact_positions(), dt))[:-1]
+    halfway = np.array([motion.speed(t + dt / 2) for t in motion.time[:-1]])
+    assert np.abs(speed - halfway).max() < 0.1          # one velocity quantum (0.06 deg/s) and the rounding of speed()
+    assert np.abs(speed - np.asarray(motion.speed_table[:-1])).max() > 1.0
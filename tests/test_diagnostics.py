@@ -0,0 +1,23 @@
+import threading
+
+import pytest
+
+from diagnostics import SamplingProfiler
+
+
+def test_profiler_counts_its_own_cpu_time(tmp_path):
+    profiler = SamplingProfiler(file_name=str(tmp_path / "profile.folded"))
+    assert profiler.interval >= SamplingProfiler.MIN_INTERVAL
+    profiler.start()
+    threading.Event().wait(0.3)
+    file_name = profiler.stop()
+
+    assert profiler.samples > 0
+    assert 0 < profiler.cpu_time < 0.3
+    with open(file_name) as profile:
+        assert sum(int(line.rsplit(" ", 1)[1]) for line in profile) == sum(profiler.stacks.values())
+
+
+def test_profiler_refuses_a_fine_interval(tmp_path):
+    with pytest.raises(ValueError):
+        SamplingProfiler(0.005, file_name=str(tmp_path / "profile.folded"))
@@ -0,0 +1,21 @@
+import pytest
+
+from feasibility import check_feasibility
+from keshner_motion import KeshnerMotion
+
+
+def test_feasible_and_infeasible_motions():
+    motion = KeshnerMotion(0.005)
+    report = check_feasibility(motion, 360*6)
+    assert report.feasible
+    assert report.peak_acc < report.acc_limit
+
+    report = check_feasibility(motion, 360, max_speed=report.peak_speed / 2)
+    assert not report.feasible
+    assert report.acc_violations and report.speed_violations
+
+
+@pytest.mark.parametrize("acc_limit, dec_limit", [(0, None), (360*6, 0), (-360, None), (0.001, None)])
+def test_non_positive_limits_are_refused(acc_limit, dec_limit):
+    with pytest.raises(ValueError):
+        check_feasibility(KeshnerMotion(0.02), acc_limit, dec_limit)
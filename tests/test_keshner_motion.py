@@ -0,0 +1,83 @@
+import os
+
+import numpy as np
+import pytest
+
+import keshner_motion
+from keshner_motion import KeshnerMotion, SumOfSinesMotion
+
+
+@pytest.fixture
+def cache_folder(tmp_path, monkeypatch):
+    monkeypatch.setattr(SumOfSinesMotion, "CACHE_FOLDER", str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def generated(monkeypatch):
+    calls = []
+    generate = SumOfSinesMotion._generate_speed_table
+    def counting(self) -> None:
+        calls.append(self.cache_key())
+        generate(self)
+    monkeypatch.setattr(SumOfSinesMotion, "_generate_speed_table", counting)
+    return calls
+
+
+def _motion(**kwargs) -> SumOfSinesMotion:
+    parameters = dict(harmonics=[1, 3], amplitudes=[10.0, 5.0], sampling_time=0.5, total_time=20)
+    parameters.update(kwargs)
+    return SumOfSinesMotion(**parameters)
+
+
+def test_cache_hit(cache_folder, generated):
+    first = _motion()
+    second = _motion()
+    assert len(generated) == 1
+    assert second.speed_table == first.speed_table
+    assert second.position_table == first.position_table
+    assert second.TIME_SHIFT == first.TIME_SHIFT
+    assert len(os.listdir(cache_folder)) == 1
+
+
+def test_cache_miss_on_parameter_change(cache_folder, generated):
+    _motion()
+    _motion(amplitudes=[10.0, 6.0])
+    _motion(sampling_time=0.25)
+    assert len(generated) == 3
+    assert len(os.listdir(cache_folder)) == 3
+
+
+def test_cache_miss_on_version_change(cache_folder, generated, monkeypatch):
+    _motion()
+    monkeypatch.setattr(SumOfSinesMotion, "CACHE_VERSION", SumOfSinesMotion.CACHE_VERSION + 1)
+    _motion()
+    assert len(generated) == 2
+
+
+def test_truncated_cache_is_generated_again(cache_folder, generated):
+    motion = _motion()
+    with open(motion._cache_file(), "r+b") as cached:
+        cached.truncate(100)
+    again = _motion()
+    assert len(generated) == 2
+    assert again.speed_table == motion.speed_table
+
+
+def test_failed_save_leaves_no_file(cache_folder, monkeypatch):
+    def failing_savez(file, **arrays) -> None:
+        file.write(b"PK\x03\x04 half a zip")
+        raise OSError("disk full")
+    monkeypatch.setattr(keshner_motion.np, "savez", failing_savez)
+    with pytest.warns(RuntimeWarning, match="disk full"):
+        _motion()
+    assert os.listdir(cache_folder) == []
+
+
+def test_next_step():
+    motion = KeshnerMotion(0.5, total_time=2, use_cache=False)
+    assert motion.next_step(0) == (1, motion.time[0], motion.speed_table[0])
+    last = len(motion.time) - 1
+    assert motion.next_step(last) == (last + 1, motion.time[-1], motion.speed_table[-1])
+    assert motion.next_step(last + 1) == (last + 1, motion.time[-1], motion.speed_table[-1])
+    assert np.isclose(motion.speed(0), 0.0, atol=0.01)
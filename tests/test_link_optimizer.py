@@ -0,0 +1,47 @@
+import API_rotation_chair
+import link_optimizer
+from simulated_drive import SimulatedDrive
+
+
+def test_moveinc_repeats_are_kept():
+    positions = [0.5 * i for i in range(10)]            # constant speed: every increment is the same
+    commands = API_rotation_chair.moveinc_table(positions, 50)
+    stream = link_optimizer.compact_stream(commands)
+    assert None not in stream
+    total = sum(int(command.split()[1]) for command in stream)
+    assert total == API_rotation_chair.deg2counts(positions[-1] - positions[0], rounding="nearest")
+
+
+def test_absolute_repeats_are_dropped():
+    stream = link_optimizer.compact_stream(["j 1.50", "j 1.5", "j 2", "moveabs 0 20", "moveabs 0 20", "acc 90", "acc 90.0"])
+    assert stream == ["j 1.5", None, "j 2", "moveabs 0 20", None, "acc 90", None]
+
+
+def _answers(drive:SimulatedDrive) -> bool:
+    drive.reset_input_buffer()
+    drive.write(b"v\r")
+    return any(drive.readline().decode('ascii').strip().startswith(link_optimizer.PROMPT) for _ in range(3))
+
+
+def test_negotiate_baud_falls_back_when_the_drive_refuses():
+    drive = SimulatedDrive(timeout=0.05)
+    assert link_optimizer.negotiate_baud(drive) == 115200
+    assert drive.baudrate == drive.drive_baudrate == 115200
+    assert _answers(drive)
+
+
+def test_negotiate_baud_switches_when_the_drive_accepts():
+    drive = SimulatedDrive(timeout=0.05, switches_baud=True)
+    assert link_optimizer.negotiate_baud(drive) == 921600
+    assert drive.baudrate == drive.drive_baudrate == 921600
+    assert _answers(drive)
+    assert link_optimizer.negotiate_baud(drive, (115200,)) == 115200
+    assert drive.drive_baudrate == 115200 and _answers(drive)
+
+
+def test_probe_fails_at_a_rate_the_drive_does_not_use():
+    drive = SimulatedDrive(timeout=0.05)          # a power-cycled drive, back at the default rate
+    drive.baudrate = 921600
+    assert not link_optimizer.probe(drive)
+    drive.baudrate = 115200
+    assert link_optimizer.probe(drive)
@@ -0,0 +1,46 @@
+import os
+import time
+
+import telemetry
+from replay import ReplayEngine
+from simulated_drive import SimulatedDrive
+
+
+def _read_responses(drive:SimulatedDrive, log:telemetry.TelemetryLog, n_prompts:int) -> None:
+    while n_prompts:
+        line = drive.readline().decode('ascii').rstrip("\r\n")
+        log.log(telemetry.RX, line)
+        if line.startswith(SimulatedDrive.PROMPT):
+            n_prompts -= 1
+
+
+def test_replay_from_the_middle_of_a_session(tmp_path):
+    file_name = os.path.join(tmp_path, "session.rclog")
+    log = telemetry.TelemetryLog(file_name)
+    drive = SimulatedDrive(timeout=0.5)
+
+    # Two commands still unanswered at t_from
+    for command in ["v", "pfb"]:
+        drive.write((command + '\r').encode('ascii'))
+        log.log(telemetry.TX, command)
+    time.sleep(0.01)
+    t_from = (time.monotonic_ns() - log.t_zero) / 1e9
+    time.sleep(0.01)
+    _read_responses(drive, log, 2)
+
+    for command in ["opmode 8", "v", "pfb", "en", "k"]:
+        drive.write((command + '\r').encode('ascii'))
+        log.log(telemetry.TX, command)
+        _read_responses(drive, log, 1)
+    log.close()
+    drive.close()
+
+    replay_drive = SimulatedDrive(timeout=0.5)
+    result = ReplayEngine(replay_drive, speed=float("inf")).run(file_name, t_from=t_from)
+    replay_drive.close()
+    assert result.commands == 5
+    assert result.mismatches == []
+
+    whole = SimulatedDrive(timeout=0.5)
+    assert ReplayEngine(whole, speed=float("inf")).run(file_name).mismatches == []
+    whole.close()
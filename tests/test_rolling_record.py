@@ -0,0 +1,36 @@
+import os
+
+import API_rotation_chair
+from rolling_record import RollingRecorder, load_record
+from simulated_drive import SimulatedDrive
+
+
+def test_windows_downloaded_with_echo_on(tmp_path):
+    drive = SimulatedDrive(timeout=0.05)
+    windows = []                # what the drive holds at every 'get', in the order of the windows
+
+    def send(command:str) -> None:
+        drive.write((command + '\r').encode('ascii'))
+        if command == API_rotation_chair.get_recorded_data():
+            windows.append([[f"{position:.3f}", f"{velocity:.3f}"] for position, velocity in drive.recording])
+
+    # Echo on, a jogging motor, and a line with a "V" in it that is not the header
+    for command in ["echo 1", "opmode 0", "en", "j 10", "Drive Inactive"]:
+        send(command)
+
+    file_name = os.path.join(tmp_path, "record.txt")
+    recorder = RollingRecorder(send, lambda: drive.readline().decode('ascii', errors='ignore'),
+                               sample_time=0.002, window_points=50, file_name=file_name)
+    recorder.run(total_time=0.5)
+    drive.close()
+
+    assert recorder.windows == len(windows) >= 4
+    assert all(windows)
+
+    with open(file_name) as file:
+        rows = [line.split("\t") for line in file.read().splitlines()[2:] if not line.startswith("#")]
+    assert [row[1:] for row in rows] == [row for window in windows for row in window]
+
+    columns, gaps = load_record(file_name, convert=False)
+    assert len(columns["time"]) == sum(len(window) for window in windows)
+    assert all(start < end for start, end in gaps)
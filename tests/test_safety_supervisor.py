@@ -0,0 +1,91 @@
+import sys
+import threading
+import time
+
+from safety_supervisor import SafetySupervisor
+from simulated_drive import SimulatedDrive
+
+
+def test_polls_while_armed():
+    polls = []
+    supervisor = SafetySupervisor(lambda command: None, threading.Lock(), on_stop=lambda reason: None,
+                                  poll=lambda: polls.append(time.perf_counter()), poll_period=0.02)
+    try:
+        time.sleep(0.1)
+        assert polls == []
+        supervisor.arm()
+        time.sleep(0.3)
+        supervisor.arm(False)
+        n_polls = len(polls)
+        assert n_polls >= 5
+        time.sleep(0.1)
+        assert len(polls) == n_polls
+    finally:
+        supervisor.close()
+
+
+def test_runaway_trips():
+    written, stopped = [], threading.Event()
+    supervisor = SafetySupervisor(written.append, threading.Lock(), runaway_tolerance=60.0, runaway_samples=3,
+                                  on_stop=lambda reason: stopped.set())
+    try:
+        supervisor.arm()
+        assert supervisor.check_command(10.0)
+        supervisor.on_readback(12.0)
+        supervisor.on_readback(100.0)
+        supervisor.on_readback(100.0)
+        assert not supervisor.tripped
+        supervisor.on_readback(100.0)
+        assert supervisor.tripped
+        assert stopped.wait(1.0)
+        assert written == ["k"]
+        assert not supervisor.allows("j 10") and not supervisor.check_command(10.0)
+        assert supervisor.allows("v")
+    finally:
+        supervisor.close()
+
+
+def test_no_motion_command_after_stop():
+    drive = SimulatedDrive(timeout=0.05)
+    lock = threading.Lock()
+    supervisor = SafetySupervisor(lambda c: drive.write((c + '\r').encode('ascii')), lock, on_stop=lambda reason: None)
+    running = True
+
+    def motion_loop() -> None:
+        while running:
+            with lock:
+                if supervisor.allows("j 1"):
+                    drive.write(b"j 1.5\r")
+            time.sleep(0.0005)
+    thread = threading.Thread(target=motion_loop, daemon=True)
+    thread.start()
+    try:
+        for _ in range(20):
+            supervisor.arm()
+            time.sleep(0.01)
+            n_received = len(drive.received)
+            supervisor.emergency_stop("test")
+            time.sleep(0.02)
+            commands = [c for _, c in drive.received[n_received:]]
+            assert "k" in commands
+            assert "j 1.5" not in commands[commands.index("k"):]
+            supervisor.reset()
+    finally:
+        running = False
+        thread.join()
+        supervisor.close()
+        drive.close()
+
+
+def test_switch_interval_lowered_only_while_armed():
+    default = sys.getswitchinterval()
+    supervisor = SafetySupervisor(lambda command: None, threading.Lock(), on_stop=lambda reason: None)
+    try:
+        assert sys.getswitchinterval() == default
+        supervisor.arm()
+        assert sys.getswitchinterval() == min(default, SafetySupervisor.SWITCH_INTERVAL)
+        supervisor.arm(False)
+        assert sys.getswitchinterval() == default
+    finally:
+        supervisor.close()
+    assert sys.getswitchinterval() == default
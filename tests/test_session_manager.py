@@ -0,0 +1,63 @@
+import time
+
+from session_manager import SessionManager
+from simulated_drive import SimulatedDrive
+
+
+def _session(**kwargs) -> tuple[SessionManager, dict[str, SimulatedDrive]]:
+    manager = SessionManager(**kwargs)
+    drives = {name: SimulatedDrive(timeout=0.05) for name in ["chair", "aux"]}
+    for name, drive in drives.items():
+        manager.add(name, drive)
+    return manager, drives
+
+
+def _commands(drive:SimulatedDrive) -> list[str]:
+    return [command for _, command in drive.received]
+
+
+def test_synchronised_streams_reach_both_drives():
+    skews = []
+    manager, drives = _session(max_skew=-1.0, on_skew=skews.append)       # every tick counts as beyond the limit
+    stream = [f"j {i}" for i in range(20)]
+    t_zero = manager.start_synchronised({name: stream for name in drives}, 0.01, lead_time=0.05)
+    time.sleep(t_zero - time.monotonic() + 20 * 0.01 + 0.1)
+    mean_skew, max_skew = manager.skew()
+    manager.close()
+
+    for drive in drives.values():
+        assert [c for c in _commands(drive) if c.startswith("j")] == stream
+    assert 0.0 <= mean_skew <= max_skew
+    assert manager.skew_failures == len(skews) == 20
+
+
+def test_stop_drops_the_queued_streams():
+    manager, drives = _session()
+    stream = [f"j {i}" for i in range(200)]
+    t_zero = manager.start_synchronised({name: stream for name in drives}, 0.01, lead_time=0.05)
+    time.sleep(t_zero - time.monotonic() + 0.2)
+    t_stop = time.monotonic()
+    manager.stop()
+    time.sleep(0.1)
+
+    for drive in drives.values():
+        commands = _commands(drive)
+        assert "k" in commands
+        assert not any(c.startswith("j") for c in commands[commands.index("k"):])
+        t_k = next(t for t, c in drive.received if c == "k")
+        assert t_k - t_stop < 0.05
+    t_start = time.monotonic()
+    manager.close()
+    assert time.monotonic() - t_start < 1.0
+
+
+def test_close_cancels_the_queued_streams():
+    manager, drives = _session()
+    stream = [f"j {i % 7}" for i in range(500)]         # 5 s of commands
+    manager.start_synchronised({name: stream for name in drives}, 0.01, lead_time=0.05)
+    time.sleep(0.1)
+    t_start = time.monotonic()
+    manager.close()
+    assert time.monotonic() - t_start < 1.0
+    for drive in drives.values():
+        assert len([c for c in _commands(drive) if c.startswith("j")]) < 100
@@ -0,0 +1,43 @@
+import os
+
+import pytest
+
+import telemetry
+
+
+EVENTS = [(telemetry.TX, "j 1.5"), (telemetry.RX, "-->"), (telemetry.STATE, "quiet=True"), (telemetry.NOTE, "ünïcode")]
+
+
+def _write(file_name:str|None = None) -> telemetry.TelemetryLog:
+    log = telemetry.TelemetryLog(file_name)
+    for kind, text in EVENTS:
+        log.log(kind, text)
+    log.close()
+    return log
+
+
+def test_round_trip(tmp_path):
+    log = _write(os.path.join(tmp_path, "session.rclog"))
+    events = list(telemetry.read_session(log.file_name))
+    assert [(e.kind, e.text) for e in events] == EVENTS
+    assert all(a.t <= b.t for a, b in zip(events, events[1:]))
+
+    replayed = []
+    telemetry.replay(iter(events), replayed.append, speed=float("inf"))
+    assert replayed == events
+    assert [e.text for e in telemetry.read_session(log.file_name, kinds={telemetry.TX, telemetry.RX})] == ["j 1.5", "-->"]
+
+
+def test_sessions_in_the_same_second_get_their_own_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(telemetry, "LOG_FOLDER", str(tmp_path))
+    logs = [_write() for _ in range(3)]
+    assert len({log.file_name for log in logs}) == 3
+    for log in logs:
+        assert [(e.kind, e.text) for e in telemetry.read_session(log.file_name)] == EVENTS
+
+
+def test_existing_file_is_not_appended(tmp_path):
+    log = _write(os.path.join(tmp_path, "session.rclog"))
+    with pytest.raises(FileExistsError):
+        telemetry.TelemetryLog(log.file_name)
+    assert [(e.kind, e.text) for e in telemetry.read_session(log.file_name)] == EVENTS
@@ -0,0 +1,263 @@
+import datetime
+import os
+import sqlite3
+import threading
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from keshner_motion import KeshnerMotion, SumOfSinesMotion
+
+
+DATABASE_FILE = "../Recorded Data/trials.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS trials (
+    id INTEGER PRIMARY KEY,
+    started TEXT NOT NULL,              -- local time, ISO 8601
+    ended TEXT,
+    participant TEXT,
+    condition TEXT,
+    stimulus TEXT NOT NULL,             -- "keshner", "partial keshner", "sum of sines"
+    sampling_time REAL,                 -- [s]
+    total_time REAL,                    -- [s]
+    fundamental_freq REAL,              -- [Hz]
+    time_shift REAL                     -- [s]
+);
+CREATE INDEX IF NOT EXISTS trials_by_stimulus ON trials (stimulus, started);
+CREATE INDEX IF NOT EXISTS trials_by_participant ON trials (participant, started);
+CREATE INDEX IF NOT EXISTS trials_by_condition ON trials (condition, started);
+CREATE INDEX IF NOT EXISTS trials_by_started ON trials (started);
+
+CREATE TABLE IF NOT EXISTS trial_bands (
+    band INTEGER NOT NULL,              -- 1, 2, 3 (see KeshnerMotion.BANDS)
+    trial_id INTEGER NOT NULL REFERENCES trials (id) ON DELETE CASCADE,
+    PRIMARY KEY (band, trial_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS trial_bands_by_trial ON trial_bands (trial_id);
+
+CREATE TABLE IF NOT EXISTS trial_harmonics (
+    harmonic INTEGER NOT NULL,
+    trial_id INTEGER NOT NULL REFERENCES trials (id) ON DELETE CASCADE,
+    amplitude REAL,                     -- [deg/s]
+    phase REAL,                         -- [rad]
+    PRIMARY KEY (harmonic, trial_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS trial_harmonics_by_trial ON trial_harmonics (trial_id);
+
+CREATE TABLE IF NOT EXISTS trial_files (
+    trial_id INTEGER NOT NULL REFERENCES trials (id) ON DELETE CASCADE,
+    kind TEXT NOT NULL,                 -- "record", "telemetry", ...
+    path TEXT NOT NULL,
+    PRIMARY KEY (trial_id, kind)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS trial_metrics (
+    trial_id INTEGER NOT NULL REFERENCES trials (id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    value REAL,
+    PRIMARY KEY (trial_id, name)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS trial_metrics_by_name ON trial_metrics (name, value);
+"""
+
+
+@dataclass
+class Trial:
+    id: int
+    started: datetime.datetime
+    ended: datetime.datetime|None
+    participant: str|None
+    condition: str|None
+    stimulus: str
+    sampling_time: float|None
+    total_time: float|None
+    fundamental_freq: float|None
+    time_shift: float|None
+    bands: list[int] = field(default_factory=list)
+    harmonics: list[tuple[int, float, float]] = field(default_factory=list)     # (harmonic, amplitude, phase)
+    files: dict[str, str] = field(default_factory=dict)
+    metrics: dict[str, float] = field(default_factory=dict)
+
+
+class TrialDatabase:
+    """
+    Local SQLite store of the trials: who, which condition, the stimulus parameters, the files written
+    and summary metrics, one row per run.\r
+    The stimulus, participant, condition and start time are indexed on the trials table; bands and harmonics
+    have their own tables keyed on the band/harmonic first, so "Keshner runs with the 3rd band last month"
+    is an index lookup instead of a scan over the recorded files.
+    Thread-safe: one connection shared under a lock.
+    """
+
+    def __init__(self, file_name:str = DATABASE_FILE) -> None:
+        if file_name != ":memory:":
+            os.makedirs(os.path.dirname(file_name) or ".", exist_ok=True)
+        self.file_name = file_name
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(file_name, check_same_thread=False)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(SCHEMA)
+
+    ### EXTERNAL FUNCTIONS
+    def add_trial(self,
+                  motion:SumOfSinesMotion,
+                  started:datetime.datetime,
+                  ended:datetime.datetime|None = None,
+                  participant:str|None = None,
+                  condition:str|None = None,
+                  files:dict[str, str]|None = None,
+                  metrics:dict[str, float]|None = None) -> int:
+        '''
+        Store a run of a motion.
+
+        :param motion: The motion that was run, its parameters are stored
+        :type motion: SumOfSinesMotion
+        :param files: Paths of the files written during the run, by kind
+        :type files: dict[str, str] | None
+        :param metrics: Summary metrics of the run, by name
+        :type metrics: dict[str, float] | None
+        :return: The id of the trial
+        :rtype: int
+        '''
+        bands = []
+        if isinstance(motion, KeshnerMotion):
+            bands = [i + 1 for i, on in enumerate(motion.bands) if on]
+            stimulus = "keshner" if all(motion.bands) else "partial keshner"
+        else:
+            stimulus = "sum of sines"
+
+        with self.lock, self.connection:
+            trial_id = self.connection.execute(
+                "INSERT INTO trials (started, ended, participant, condition, stimulus, sampling_time, total_time, fundamental_freq, time_shift) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (started.isoformat(timespec="seconds"), ended.isoformat(timespec="seconds") if ended else None,
+                 participant or None, condition or None, stimulus,
+                 motion.sampling_time, motion.TIME_TOTAL, motion.FUNDAMENTAL_FREQ, motion.TIME_SHIFT)).lastrowid
+            self.connection.executemany("INSERT INTO trial_bands (band, trial_id) VALUES (?, ?)",
+                                        [(band, trial_id) for band in bands])
+            self.connection.executemany("INSERT INTO trial_harmonics (harmonic, trial_id, amplitude, phase) VALUES (?, ?, ?, ?)",
+                                        [(h, trial_id, a, d) for h, a, d in zip(motion.HOMONICS, motion.ANG_SPEED_HOMONICS, motion.PHASES)])
+            self.connection.executemany("INSERT INTO trial_files (trial_id, kind, path) VALUES (?, ?, ?)",
+                                        [(trial_id, kind, os.path.abspath(path)) for kind, path in (files or {}).items()])
+            self.connection.executemany("INSERT INTO trial_metrics (trial_id, name, value) VALUES (?, ?, ?)",
+                                        [(trial_id, name, float(value)) for name, value in (metrics or {}).items()])
+        return trial_id
+
+    def query(self,
+              stimulus:str|None = None,
+              participant:str|None = None,
+              condition:str|None = None,
+              band:int|None = None,
+              harmonic:int|None = None,
+              since:datetime.datetime|None = None,
+              until:datetime.datetime|None = None,
+              limit:int|None = None) -> list[Trial]:
+        '''
+        Find trials; every given criterion has to match. Newest first.
+
+        :param stimulus: "keshner", "partial keshner" or "sum of sines"
+        :param band: A Keshner band (1, 2, 3) that was included
+        :param harmonic: A harmonic number that was included
+        :param since: Started at or after
+        :param until: Started before
+        :rtype: list[Trial]
+        '''
+        where, args = [], []
+        for column, value in [("stimulus", stimulus), ("participant", participant), ("condition", condition)]:
+            if value is not None:
+                where.append(f"{column} = ?")
+                args.append(value)
+        if since is not None:
+            where.append("started >= ?")
+            args.append(since.isoformat(timespec="seconds"))
+        if until is not None:
+            where.append("started < ?")
+            args.append(until.isoformat(timespec="seconds"))
+        if band is not None:
+            where.append("id IN (SELECT trial_id FROM trial_bands WHERE band = ?)")
+            args.append(band)
+        if harmonic is not None:
+            where.append("id IN (SELECT trial_id FROM trial_harmonics WHERE harmonic = ?)")
+            args.append(harmonic)
+
+        sql = "SELECT * FROM trials" + (" WHERE " + " AND ".join(where) if where else "") + " ORDER BY started DESC"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+
+        with self.lock:
+            rows = self.connection.execute(sql, args).fetchall()
+            return [self._load(row) for row in rows]
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
+        return
+
+
+    ### INTERNAL FUNCTIONS
+    def _load(self, row:tuple) -> Trial:
+        trial = Trial(row[0], datetime.datetime.fromisoformat(row[1]),
+                      datetime.datetime.fromisoformat(row[2]) if row[2] else None, *row[3:])
+        trial.bands = [b for (b,) in self.connection.execute(
+            "SELECT band FROM trial_bands WHERE trial_id = ? ORDER BY band", (trial.id,))]
+        trial.harmonics = self.connection.execute(
+            "SELECT harmonic, amplitude, phase FROM trial_harmonics WHERE trial_id = ? ORDER BY harmonic", (trial.id,)).fetchall()
+        trial.files = dict(self.connection.execute("SELECT kind, path FROM trial_files WHERE trial_id = ?", (trial.id,)))
+        trial.metrics = dict(self.connection.execute("SELECT name, value FROM trial_metrics WHERE trial_id = ?", (trial.id,)))
+        return trial
+
+
+def record_metrics(columns:dict[str, np.ndarray], gaps:list[tuple[float, float]], motion:SumOfSinesMotion, t_offset:float = 0.0) -> dict[str, float]:
+    '''
+    Summary metrics of a recorded run (see rolling_record.load_record) against the commanded motion.
+
+    :param columns: The recorded columns, converted to deg and deg/s
+    :param gaps: The gaps of the record
+    :param motion: The commanded motion
+    :param t_offset: Time of the start of the record on the time axis of the motion [s]
+    :return: Recorded samples and gap time, measured peak speed, and the RMS and maximum speed error [deg/s]
+    :rtype: dict[str, float]
+    '''
+    metrics = {
+        "record_samples": len(columns["time"]),
+        "record_gap_time": sum(end - start for start, end in gaps),
+    }
+    if "V" in columns and len(columns["V"]):
+        t = columns["time"] + t_offset
+        inside = (t >= motion.time[0]) & (t <= motion.time[-1])
+        error = columns["V"][inside] - np.interp(t[inside], motion.time, motion.speed_table)
+        metrics["measured_peak_speed"] = float(np.abs(columns["V"]).max())
+        if len(error):
+            metrics["speed_error_rms"] = float(np.sqrt(np.mean(error ** 2)))
+            metrics["speed_error_max"] = float(np.abs(error).max())
+    return metrics
+
+
+if __name__ == "__main__":
+    import random
+    import time
+
+    # Query time on a filled database
+    database = TrialDatabase(":memory:")
+    motions = [KeshnerMotion(0.5, bands=bands) for bands in
+               [(True, True, True), (True, False, False), (False, True, False), (False, False, True), (True, True, False)]]
+    now = datetime.datetime.now()
+    random.seed(0)
+    t_start = time.perf_counter()
+    for i in range(20000):
+        motion = random.choice(motions)
+        database.add_trial(motion, now - datetime.timedelta(days=random.uniform(0, 730)),
+                           participant=f"P{random.randrange(200):03d}", condition=random.choice(["light", "dark"]),
+                           files={"record": f"motion_record_{i}.txt"}, metrics={"speed_error_rms": random.random()})
+    print(f"20000 trials stored in {time.perf_counter() - t_start:.1f} s")
+
+    month_ago = now - datetime.timedelta(days=30)
+    t_start = time.perf_counter()
+    trials = database.query(stimulus="partial keshner", band=3, since=month_ago)
+    print(f"Partial Keshner runs with the 3rd band in the last month: {len(trials)} in {(time.perf_counter() - t_start)*1000:.1f} ms")
+    for row in database.connection.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM trials WHERE stimulus = ? AND started >= ? AND id IN (SELECT trial_id FROM trial_bands WHERE band = ?)",
+            ("partial keshner", month_ago.isoformat(), 3)):
+        print("\t" + row[-1])
+    database.close()